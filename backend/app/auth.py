@@ -1,11 +1,17 @@
-import os
+import os, time, asyncio, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from .database import get_db
 from .models import User
+from .cache import TTLCache, bump_shared_version, shared_version
+from .metrics import Counter, Timer, register_section
 
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
@@ -13,17 +19,58 @@ JWT_ALG = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 COOKIE_NAME = os.getenv("AUTH_COOKIE_NAME", "access_token")
 COOKIE_DOMAIN = os.getenv("AUTH_COOKIE_DOMAIN", None)
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))  # ดู get_current_user
+AUTH_USER_CACHE_MAXSIZE = int(os.getenv("AUTH_USER_CACHE_MAXSIZE", "1024"))
+AUTH_TOKEN_CACHE_MAXSIZE = int(os.getenv("AUTH_TOKEN_CACHE_MAXSIZE", "4096"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "2"))
+BCRYPT_MAX_QUEUE = int(os.getenv("BCRYPT_MAX_QUEUE", "32"))  # คำขอที่รอได้นอกเหนือจาก worker; เกินแล้วตอบ 503
+
+
+# hash ที่ rounds ต่ำกว่า BCRYPT_ROUNDS จะถูก hash ใหม่ตอน login สำเร็จ (verify_and_update)
+pwd = CryptContext(
+	schemes=["bcrypt"],
+	deprecated="auto",
+	bcrypt__default_rounds=BCRYPT_ROUNDS,
+	bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt ใช้ CPU หลายร้อย ms ต่อครั้ง → รันใน executor แยกที่จำกัดจำนวนพร้อมกัน
+# endpoint เป็น async แล้ว await ผล จึงไม่กิน thread ของ FastAPI ระหว่างรอ และคิวจำกัดที่ BCRYPT_MAX_QUEUE
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_lock = threading.Lock()
+_bcrypt_pending = 0
+_bcrypt_rejected = Counter()
+_bcrypt_time = Timer()
+
+
+async def _run_bcrypt(fn, *args):
+	global _bcrypt_pending
+	with _bcrypt_lock:
+		if _bcrypt_pending >= BCRYPT_MAX_WORKERS + BCRYPT_MAX_QUEUE:
+			_bcrypt_rejected.inc()
+			raise HTTPException(status_code=503, detail="Server busy, please retry")
+		_bcrypt_pending += 1
+	t0 = time.perf_counter()
+	try:
+		return await asyncio.get_running_loop().run_in_executor(_bcrypt_executor, fn, *args)
+	finally:
+		_bcrypt_time.observe(time.perf_counter() - t0)
+		with _bcrypt_lock:
+			_bcrypt_pending -= 1
 
 
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+async def hash_password(password: str) -> str:
+	return await _run_bcrypt(pwd.hash, password)
 
 
-def hash_password(password: str) -> str:
-	return pwd.hash(password)
+async def verify_password(password: str, hashed: str) -> bool:
+	return await _run_bcrypt(pwd.verify, password, hashed)
 
 
-def verify_password(password: str, hashed: str) -> bool:
-	return pwd.verify(password, hashed)
+async def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+	"""(ถูกต้องหรือไม่, hash ใหม่ถ้าควรอัปเดต) — hash ใหม่เกิดเมื่อ rounds ของ hash เดิมต่ำกว่า BCRYPT_ROUNDS"""
+	return await _run_bcrypt(pwd.verify_and_update, password, hashed)
 
 
 def create_access_token(sub: str, extra: dict | None = None, expires_minutes: int | None = None) -> str:
@@ -52,18 +99,131 @@ def clear_auth_cookie(response):
 	response.delete_cookie(COOKIE_NAME, domain=COOKIE_DOMAIN, path="/")
 
 
+class TokenCache:
+	"""ผล jwt.decode ต่อ token — เก็บไว้จนถึงเวลา exp ของ token นั้น (LRU ขนาดจำกัด)"""
+
+	def __init__(self, maxsize: int):
+		self.maxsize = maxsize
+		self._data: OrderedDict[str, dict] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, token: str) -> dict | None:
+		with self._lock:
+			payload = self._data.get(token)
+			if payload is None:
+				return None
+			if payload["exp"] <= time.time():
+				del self._data[token]
+				return None
+			self._data.move_to_end(token)
+			return payload
+
+	def set(self, token: str, payload: dict) -> None:
+		with self._lock:
+			self._data[token] = payload
+			self._data.move_to_end(token)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+
+_token_cache = TokenCache(AUTH_TOKEN_CACHE_MAXSIZE)
+_user_cache = TTLCache(AUTH_USER_CACHE_MAXSIZE, AUTH_USER_CACHE_TTL)
+_token_hits = Counter()
+_token_misses = Counter()
+_user_hits = Counter()
+_user_misses = Counter()
+
+
+def decode_token(token: str) -> dict:
+	payload = _token_cache.get(token)
+	if payload is not None:
+		_token_hits.inc()
+		return payload
+	_token_misses.inc()
+	try:
+		payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+	except JWTError:
+		raise HTTPException(status_code=401, detail="Invalid token")
+	if not payload.get("sub"):
+		raise HTTPException(status_code=401, detail="Invalid token")
+	if "exp" in payload:
+		_token_cache.set(token, payload)
+	return payload
+
+
+def _user_key(uid) -> str:
+	return f"v{shared_version('users_version')}:{uid}"
+
+
+def invalidate_user(user_id: int) -> None:
+	_user_cache.set(_user_key(user_id), None)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_change(mapper, connection, target):
+	invalidate_user(target.user_id)
+	session = object_session(target)
+	if session is not None:
+		session.info["users_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+	# process อื่น (uvicorn worker อื่น) เห็น users_version ใหม่ → key เดิมของ user ทุกคนใช้ไม่ได้
+	# ตัวนับแยกจาก data_version ของ response cache: แก้ user ไม่ล้าง response/ETag และ ingest ไม่ล้าง user cache
+	if session.info.pop("users_changed", False):
+		bump_shared_version("users_version")
+
+
+def _load_user(db: Session, uid: int | None, sub: str) -> User | None:
+	if uid is not None:
+		user = db.get(User, uid)
+	else:
+		user = db.query(User).filter(User.username == sub).first()
+	if user is not None:
+		# แยกออกจาก session ของ request นี้ก่อนเก็บลง cache (ใช้อ่านค่า column เท่านั้น)
+		db.expunge(user)
+	return user
+
+
 async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
 	token = request.cookies.get(COOKIE_NAME)
 	if not token:
 		raise HTTPException(status_code=401, detail="Not authenticated")
-	try:
-		payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-		sub: str = payload.get("sub")
-		if not sub:
-			raise HTTPException(status_code=401, detail="Invalid token")
-	except JWTError as e:
-		raise HTTPException(status_code=401, detail="Invalid token")
-	user = db.query(User).filter(User.username == sub).first()
-	if not user:
+	payload = decode_token(token)
+	sub: str = payload["sub"]
+	uid = payload.get("uid")
+
+	# key ผูกกับ users_version ที่ใช้ร่วมกันทุก process: แก้/ลบ user ผ่าน ORM มีผลทุก worker ทันทีหลัง commit
+	# การแก้ตาราง users ด้วย SQL ตรง (ไม่ผ่าน ORM) ยังค้างได้นานสุด AUTH_USER_CACHE_TTL วินาที
+	key = _user_key(uid)
+	user = _user_cache.get(key) if uid is not None else None
+	if user is not None and user.username == sub:
+		_user_hits.inc()
+		return user
+
+	_user_misses.inc()
+	user = await run_in_threadpool(_load_user, db, uid, sub)
+	if not user or user.username != sub:
 		raise HTTPException(status_code=401, detail="User not found")
-	return user
\ No newline at end of file
+	if uid is not None:
+		_user_cache.set(key, user)
+	return user
+
+
+def _auth_metrics() -> dict:
+	return {
+		"token_cache": {"hits": _token_hits.value, "misses": _token_misses.value},
+		"user_cache": {"hits": _user_hits.value, "misses": _user_misses.value, "entries": len(_user_cache)},
+		"bcrypt": {
+			"workers": BCRYPT_MAX_WORKERS,
+			"in_flight": min(_bcrypt_pending, BCRYPT_MAX_WORKERS),
+			"queue_depth": max(_bcrypt_pending - BCRYPT_MAX_WORKERS, 0),
+			"rejected": _bcrypt_rejected.value,
+			"latency": _bcrypt_time.as_dict(),
+		},
+	}
+
+
+register_section("auth", _auth_metrics)
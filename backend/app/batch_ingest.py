@@ -0,0 +1,181 @@
+"""
+ingest NetCDF หลายไฟล์พร้อมกัน (เช่น backfill CHIRPS รายปีหลายสิบไฟล์)
+
+    cd backend && python -m app.batch_ingest /data/storage/chirps/ --owner admin --workers 4
+
+- worker (ProcessPoolExecutor) อ่านไฟล์ + สรุปรายอำเภอ/วัน โดยไม่แตะ DB
+- process แม่เป็นผู้เขียน DB คนเดียว: upsert ลง rain_points ทีละไฟล์ (transaction ละไฟล์)
+- mapping กริด → อำเภอ และ ADM2 (GeoParquet) สร้างครั้งเดียวใน process แม่ก่อนเริ่ม pool
+  แล้ว worker โหลดจาก cache บนดิสก์ (STORAGE_DIR/cache)
+"""
+from __future__ import annotations
+import os, argparse, glob, logging, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from sqlalchemy import insert
+
+from .database import SessionLocal, engine
+from .models import User, UploadRainPoint
+from .boundaries import load_adm2_north
+from .partitions import ensure_rain_partitions
+from .summary import refresh_daily_summary
+from .cache import bump_data_version
+from .utils import (
+    NC_INCREMENTAL, RAIN_AGG_MODE, aggregate_nc_file, latest_rain_date, load_area_frames,
+    load_cell_district_weights, open_precip_th, to_rain_points_frame, upsert_rain_points,
+)
+
+
+logger = logging.getLogger("batch_ingest")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "/data/storage")
+PROV_BOUNDARY = os.getenv(
+    "PROVINCE_BOUNDARY_PATH",
+    os.path.join(STORAGE_DIR, "admin/tha_admbnda_adm2_rtsd_20220121.shp")
+)
+
+
+def collect_nc_files(paths: list[str]) -> list[str]:
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(sorted(glob.glob(os.path.join(p, "*.nc"))))
+        else:
+            files.append(p)
+    return files
+
+
+def _warm_boundaries(nc_files: list[str], adm2_shp_path: str) -> None:
+    """สร้าง cache ขอบเขต + weights ของทุก grid ที่ต่างกันไว้ก่อน worker เริ่ม (ไม่ต้องคำนวณซ้ำในแต่ละ process)"""
+    load_adm2_north(adm2_shp_path)
+    if RAIN_AGG_MODE == "points":
+        return
+    for nc_path in nc_files:
+        ds, da = open_precip_th(nc_path)
+        try:
+            load_cell_district_weights(da["latitude"].to_numpy(), da["longitude"].to_numpy(), adm2_shp_path)
+        finally:
+            ds.close()
+
+
+def _aggregate_worker(nc_path: str, adm2_shp_path: str, time_chunk: int | None, after) -> tuple[str, pd.DataFrame, float]:
+    t0 = time.perf_counter()
+    daily = aggregate_nc_file(nc_path, adm2_shp_path, time_chunk=time_chunk, after=after)
+    return nc_path, daily, time.perf_counter() - t0
+
+
+def _write_file(db, nc_path: str, daily: pd.DataFrame, owner_id: int, area_frames) -> dict[str, int]:
+    """สร้าง UploadRainPoint ของไฟล์ แล้ว upsert ผลสรุปใน transaction เดียว (ล้มกลางทาง → ไม่เหลือแถว upload ค้าง)"""
+    df_points = to_rain_points_frame(daily, *area_frames, None)
+    if df_points.empty:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    bind = db.get_bind()
+    with bind.begin() as conn:
+        ensure_rain_partitions(conn, sorted(df_points["year"].unique()))
+    with bind.begin() as conn:
+        df_points["upload_id"] = conn.execute(
+            insert(UploadRainPoint)
+            .values(
+                filename=os.path.basename(nc_path),
+                storage_path=os.path.abspath(nc_path),
+                size_bytes=os.path.getsize(nc_path),
+                content_type="application/x-netcdf",
+                owner_id=owner_id,
+            )
+            .returning(UploadRainPoint.upload_id)
+        ).scalar_one()
+        counts = upsert_rain_points(conn, df_points)
+        refresh_daily_summary(conn, df_points["date"].min(), df_points["date"].max())
+    bump_data_version()
+    return counts
+
+
+def run_batch(
+    nc_files: list[str],
+    owner: str,
+    adm2_shp_path: str = PROV_BOUNDARY,
+    workers: int | None = None,
+    time_chunk: int | None = None,
+    incremental: bool = NC_INCREMENTAL,
+) -> dict[str, float]:
+    workers = workers or min(len(nc_files), os.cpu_count() or 1)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == owner).first()
+        if user is None:
+            raise SystemExit(f"ไม่พบผู้ใช้ '{owner}'")
+        area_frames = load_area_frames(db)
+        # incremental: แต่ละไฟล์อ่านเฉพาะวันที่ใหม่กว่าที่มีใน DB ของไฟล์ชื่อเดียวกัน
+        after = {
+            nc_path: latest_rain_date(db, os.path.basename(nc_path)) if incremental else None
+            for nc_path in nc_files
+        }
+
+        t_start = time.perf_counter()
+        _warm_boundaries(nc_files, adm2_shp_path)
+        logger.info("boundary cache ready in %.2fs", time.perf_counter() - t_start)
+
+        total_rows = 0
+        failed = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(_aggregate_worker, nc_path, adm2_shp_path, time_chunk, after[nc_path]): nc_path
+                for nc_path in nc_files
+            }
+            for fut in as_completed(futures):
+                nc_path = futures[fut]
+                try:
+                    _, daily, t_agg = fut.result()
+                    t0 = time.perf_counter()
+                    counts = _write_file(db, nc_path, daily, user.user_id, area_frames)
+                    t_write = time.perf_counter() - t0
+                except Exception as e:
+                    db.rollback()
+                    logger.exception("batch ingest %s failed: %s", nc_path, e)
+                    failed.append(nc_path)
+                    continue
+
+                rows = counts["inserted"] + counts["updated"] + counts["unchanged"]
+                total_rows += rows
+                print(f"{os.path.basename(nc_path)}: aggregate {t_agg:7.2f}s  write {t_write:6.2f}s  "
+                      f"{rows:>8,} rows  inserted={counts['inserted']:,} updated={counts['updated']:,} "
+                      f"unchanged={counts['unchanged']:,}", flush=True)
+
+        elapsed = time.perf_counter() - t_start
+    finally:
+        db.close()
+
+    done = len(nc_files) - len(failed)
+    print(f"total: {done}/{len(nc_files)} files, {total_rows:,} rows in {elapsed:.2f}s "
+          f"({done / max(elapsed, 1e-9):.2f} files/s, {total_rows / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"workers={workers})")
+    for nc_path in failed:
+        print(f"failed: {nc_path}")
+    return {"files": done, "failed": len(failed), "rows": total_rows, "seconds": elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ingest NetCDF หลายไฟล์แบบขนาน")
+    parser.add_argument("paths", nargs="+", help="ไฟล์ .nc หรือโฟลเดอร์ที่มีไฟล์ .nc")
+    parser.add_argument("--owner", required=True, help="username เจ้าของ upload_rain_point")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "0")) or None)
+    parser.add_argument("--time-chunk", type=int, default=None)
+    parser.add_argument("--shp", default=PROV_BOUNDARY)
+    parser.add_argument("--incremental", action="store_true", help="อ่านเฉพาะวันที่ใหม่กว่าที่มีใน DB ของไฟล์ชื่อเดียวกัน")
+    parser.add_argument("--full-reload", action="store_true", help="ประมวลผลทุกวันในไฟล์ แม้ตั้ง NC_INCREMENTAL=1")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    nc_files = collect_nc_files(args.paths)
+    if not nc_files:
+        raise SystemExit("ไม่พบไฟล์ .nc")
+    result = run_batch(nc_files, args.owner, adm2_shp_path=args.shp, workers=args.workers,
+                       time_chunk=args.time_chunk, incremental=(NC_INCREMENTAL or args.incremental) and not args.full_reload)
+    if result["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+import os, logging, hashlib, threading
+import geopandas as gpd
+
+
+logger = logging.getLogger("boundaries")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "/data/storage")
+CACHE_DIR = os.path.join(STORAGE_DIR, "cache")
+
+_lock = threading.Lock()
+_adm2_cache: dict[str, tuple[str, gpd.GeoDataFrame]] = {}
+_north_cache: dict[tuple[str, tuple[str, ...]], gpd.GeoDataFrame] = {}
+
+
+def north_provinces_en() -> list[str]:
+    north_env = os.getenv(
+        "NORTH_PROVS_EN",
+        "Chiang Mai,Chiang Rai,Lamphun,Lampang,Phayao,Phrae,Nan,Mae Hong Son,Uttaradit"
+    )
+    return [x.strip() for x in north_env.split(",")]
+
+
+def select_provinces(adm2: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """แถว ADM2 ของจังหวัดที่ใช้งานตาม NORTH_PROVS_EN — ตั้งค่าเป็น "all" = ทั้งประเทศ"""
+    provs = north_provinces_en()
+    if [p.lower() for p in provs] == ["all"]:
+        return adm2
+    return adm2[adm2["ADM1_EN"].isin(provs)]
+
+
+def file_signature(path: str) -> str:
+    """path + mtime + size ของ .shp และไฟล์ประกอบ (.dbf/.shx/.prj) — เปลี่ยนเมื่อไฟล์ใดไฟล์หนึ่งถูกแก้"""
+    stem, _ = os.path.splitext(path)
+    parts = [os.path.abspath(path)]
+    for p in [path] + [stem + ext for ext in (".dbf", ".shx", ".prj")]:
+        if os.path.exists(p):
+            st = os.stat(p)
+            parts.append(f"{os.path.basename(p)}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def _parquet_path(path: str, signature: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(signature.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{stem}_{digest}.parquet")
+
+
+def _read_adm2(path: str, signature: str) -> gpd.GeoDataFrame:
+    """อ่านสำเนา GeoParquet ถ้ามี (cold start เร็ว) ไม่งั้นอ่าน shapefile แล้วบันทึกสำเนาไว้"""
+    parquet_path = _parquet_path(path, signature)
+    if os.path.exists(parquet_path):
+        return gpd.read_parquet(parquet_path)
+
+    gdf = gpd.read_file(path, encoding="utf-8").to_crs("EPSG:4326")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        gdf.to_parquet(tmp_path)
+        os.replace(tmp_path, parquet_path)
+    except (ImportError, OSError) as e:
+        logger.warning("cannot write boundary cache %s: %s", parquet_path, e)
+    return gdf
+
+
+def load_adm2(path: str) -> gpd.GeoDataFrame:
+    """ADM2 ทั้งประเทศ (EPSG:4326) โหลดครั้งเดียวต่อ process — โหลดใหม่เมื่อไฟล์เปลี่ยน (file_signature)"""
+    signature = file_signature(path)
+    with _lock:
+        hit = _adm2_cache.get(path)
+        if hit is not None and hit[0] == signature:
+            return hit[1]
+
+        gdf = _read_adm2(path, signature)
+        _adm2_cache[path] = (signature, gdf)
+        for key in [k for k in _north_cache if k[0] == path]:
+            del _north_cache[key]
+        logger.info("loaded ADM2 boundaries %s (%d polygons)", path, len(gdf))
+        return gdf
+
+
+def load_adm2_north(path: str) -> gpd.GeoDataFrame:
+    """ADM2 เฉพาะจังหวัดภาคเหนือ → คอลัมน์ province, district, geometry (สร้าง spatial index ไว้แล้ว)"""
+    adm2 = load_adm2(path)
+    key = (path, tuple(north_provinces_en()))
+    with _lock:
+        hit = _north_cache.get(key)
+        if hit is not None:
+            return hit
+
+        adm2_north = select_provinces(adm2)[["ADM1_EN","ADM2_EN","geometry"]].copy()
+        adm2_north = adm2_north.rename(columns={"ADM1_EN":"province","ADM2_EN":"district"}).reset_index(drop=True)
+        adm2_north.sindex  # สร้าง STRtree ครั้งเดียว ใช้ซ้ำใน sjoin
+        _north_cache[key] = adm2_north
+        return adm2_north
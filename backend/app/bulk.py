@@ -0,0 +1,159 @@
+from __future__ import annotations
+import io, logging, time
+import pandas as pd
+from sqlalchemy import column, table as sa_table, text
+
+from .database import Base
+
+
+logger = logging.getLogger("bulk")
+COPY_BATCH_ROWS = 50_000
+
+
+def _copy_psycopg(conn, df: pd.DataFrame, table_name: str) -> None:
+    """COPY ... FROM STDIN (CSV) บน psycopg connection ที่อยู่หลัง SQLAlchemy Connection (transaction เดียวกัน)"""
+    from psycopg import sql
+
+    raw = conn.connection.driver_connection
+    stmt = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table_name),
+        sql.SQL(", ").join(sql.Identifier(c) for c in df.columns),
+    )
+    with raw.cursor() as cur:
+        with cur.copy(stmt) as copy:
+            for start in range(0, len(df), COPY_BATCH_ROWS):
+                buf = io.StringIO()
+                # ค่าว่างแบบไม่ใส่ quote = NULL ใน CSV ของ Postgres
+                df.iloc[start:start + COPY_BATCH_ROWS].to_csv(buf, index=False, header=False, na_rep="")
+                copy.write(buf.getvalue())
+
+
+def _executemany(conn, df: pd.DataFrame, table_name: str) -> None:
+    table = Base.metadata.tables.get(table_name)
+    if table is None:
+        # เช่น staging temp table: ไม่มี type ก็ได้ ให้ DBAPI bind ค่าตรง ๆ
+        table = sa_table(table_name, *(column(c) for c in df.columns))
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    conn.execute(table.insert(), records)
+
+
+def bulk_insert_df(conn, df: pd.DataFrame, table_name: str) -> int:
+    """
+    เขียน DataFrame ลงตาราง (append) ผ่าน Connection ที่เปิด transaction อยู่แล้ว
+    - Postgres + psycopg: COPY FROM STDIN
+    - engine อื่น (เช่น SQLite): executemany
+    """
+    if df.empty:
+        return 0
+
+    t0 = time.perf_counter()
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg":
+        _copy_psycopg(conn, df, table_name)
+    else:
+        _executemany(conn, df, table_name)
+    elapsed = time.perf_counter() - t0
+
+    logger.info("bulk insert %s: %d rows in %.3fs (%.0f rows/s)",
+                table_name, len(df), elapsed, len(df) / max(elapsed, 1e-9))
+    return len(df)
+
+
+def _staged_insert(
+    conn,
+    df: pd.DataFrame,
+    table_name: str,
+    key_cols: list[str],
+    conflict_sql: str,
+    returning: list[str],
+    count_existing: bool = False,
+) -> tuple[list, int | None]:
+    """
+    COPY df ลง staging (temp table โครงสร้างเดียวกับ table_name) แล้ว
+    INSERT ... SELECT FROM staging ON CONFLICT (key_cols) <conflict_sql> RETURNING <returning>
+    คืน (แถวที่ถูกเขียนจริง, จำนวนแถวใน df ที่ key มีอยู่แล้วก่อนเขียน ถ้า count_existing) — staging ถูกลบเสมอ
+    """
+    col_list = ", ".join(df.columns)
+    staging = f"staging_{table_name}"
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    conn.execute(text(f"CREATE TEMP TABLE {staging} AS SELECT {col_list} FROM {table_name} WHERE 1 = 0"))
+    try:
+        bulk_insert_df(conn, df, staging)
+
+        existing = None
+        if count_existing:
+            key_match = " AND ".join(f"t.{c} = s.{c}" for c in key_cols)
+            existing = conn.execute(text(f"""
+                SELECT COUNT(*) FROM {staging} s JOIN {table_name} t ON {key_match}
+            """)).scalar_one()
+
+        # WHERE 1 = 1: ให้ SQLite แยก ON CONFLICT ออกจาก SELECT ได้
+        rows = conn.execute(text(f"""
+            INSERT INTO {table_name} ({col_list})
+            SELECT {col_list} FROM {staging} WHERE 1 = 1
+            ON CONFLICT ({", ".join(key_cols)}) {conflict_sql}
+            RETURNING {", ".join(returning)}
+        """)).all()
+    finally:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    return rows, existing
+
+
+def upsert_df(
+    conn,
+    df: pd.DataFrame,
+    table_name: str,
+    key_cols: list[str],
+    compare_cols: list[str],
+) -> dict[str, int]:
+    """
+    เขียนแบบ idempotent ผ่าน staging: INSERT ... ON CONFLICT (key_cols) DO UPDATE
+    เฉพาะแถวที่ค่าใน compare_cols เปลี่ยนจริง
+    ต้องมี unique index บน key_cols — คืน {"inserted", "updated", "unchanged"}
+    """
+    if df.empty:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    df = df.drop_duplicates(subset=key_cols, keep="last")
+    update_cols = [c for c in df.columns if c not in key_cols]
+    set_clause = ", ".join(f"{c} = excluded.{c}" for c in update_cols)
+    changed = " OR ".join(f"{table_name}.{c} IS DISTINCT FROM excluded.{c}" for c in compare_cols)
+    rows, existing = _staged_insert(
+        conn, df, table_name, key_cols,
+        conflict_sql=f"DO UPDATE SET {set_clause} WHERE {changed}",
+        returning=["1"],
+        count_existing=True,
+    )
+
+    inserted = len(df) - existing
+    updated = len(rows) - inserted
+    return {"inserted": inserted, "updated": updated, "unchanged": existing - updated}
+
+
+def insert_new_df(
+    conn,
+    df: pd.DataFrame,
+    table_name: str,
+    key_cols: list[str],
+    returning: list[str],
+    sum_cols: list[str] | None = None,
+) -> tuple[pd.DataFrame, dict[str, int]]:
+    """
+    INSERT ผ่าน staging โดยให้ DB ตัด key ที่มีอยู่แล้วเอง (ไม่ต้องดึง key เดิมมาเทียบ)
+    - sum_cols=None: DO NOTHING → key ที่มีอยู่แล้วถูกข้าม
+    - sum_cols=[...]: DO UPDATE บวกค่าเข้ากับแถวเดิม
+    ต้องมี unique index บน key_cols — คืน (คอลัมน์ returning ของแถวที่ถูกเขียนจริง, {"inserted", "updated", "skipped"})
+    """
+    if df.empty:
+        return pd.DataFrame(columns=returning), {"inserted": 0, "updated": 0, "skipped": 0}
+
+    if sum_cols:
+        set_clause = ", ".join(f"{c} = {table_name}.{c} + excluded.{c}" for c in sum_cols)
+        conflict_sql = f"DO UPDATE SET {set_clause}"
+    else:
+        conflict_sql = "DO NOTHING"
+
+    rows, existing = _staged_insert(conn, df, table_name, key_cols, conflict_sql, returning, count_existing=True)
+    inserted = len(df) - existing
+    updated = len(rows) - inserted
+    return pd.DataFrame(rows, columns=returning), {"inserted": inserted, "updated": updated, "skipped": existing - updated}
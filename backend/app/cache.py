@@ -0,0 +1,195 @@
+"""
+cache ของ response สำหรับ endpoint ที่ข้อมูลแทบไม่เปลี่ยน (list_province, list_district, get_date_limit)
+
+- key = data version + path + query params → ingest / init_data เรียก bump_data_version() หลัง commit
+  ทำให้ key เก่าทั้งหมดใช้ไม่ได้ทันที (ไม่ต้องไล่ลบ)
+- backend: in-process TTL/LRU (ค่าเริ่มต้น) หรือ Redis ถ้าตั้ง REDIS_URL และติดตั้ง redis
+- data version อยู่ในไฟล์ใต้ STORAGE_DIR/cache (หรือ Redis) จึงใช้ร่วมกันระหว่าง process
+  ทั้ง uvicorn worker และ ingest worker
+- ส่ง ETag + Cache-Control: no-cache → browser ส่ง If-None-Match กลับมาแล้วได้ 304 ถ้าไม่เปลี่ยน
+"""
+from __future__ import annotations
+import os, time, fcntl, logging, hashlib, threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from .metrics import Counter, register_section
+
+
+logger = logging.getLogger("cache")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "/data/storage")
+VERSION_DIR = os.path.join(STORAGE_DIR, "cache")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "256"))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_PREFIX = "landslide:"
+
+
+class TTLCache:
+    """LRU ขนาดจำกัด + หมดอายุตาม ttl (วินาที)"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, tuple[str, bytes]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """backend แบบ Redis (หรือ server ที่พูด protocol เดียวกัน) — ใช้ร่วมกันได้หลาย worker"""
+
+    def __init__(self, url: str, ttl: float):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        try:
+            body = self.client.get(REDIS_PREFIX + key)
+        except Exception as e:
+            logger.warning("redis get failed: %s", e)
+            return None
+        return None if body is None else (_etag(body), body)
+
+    def set(self, key: str, value) -> None:
+        try:
+            self.client.setex(REDIS_PREFIX + key, max(1, int(self.ttl)), value[1])
+        except Exception as e:
+            logger.warning("redis set failed: %s", e)
+
+    def __len__(self) -> int:
+        return -1
+
+
+def _make_backend():
+    if REDIS_URL:
+        try:
+            return RedisCache(REDIS_URL, RESPONSE_CACHE_TTL)
+        except ImportError:
+            logger.warning("REDIS_URL is set but redis is not installed; using in-process cache")
+    return TTLCache(RESPONSE_CACHE_MAXSIZE, RESPONSE_CACHE_TTL)
+
+
+_backend = _make_backend()
+_hits = Counter()
+_misses = Counter()
+_not_modified = Counter()
+
+
+# ---------------- Data version ----------------
+# ตัวนับที่ใช้ร่วมกันทุก process (ไฟล์ใต้ STORAGE_DIR/cache หรือ Redis) แยกตามชื่อ:
+# "data_version" สำหรับ response cache, "users_version" สำหรับ user cache ของ auth
+def shared_version(name: str) -> int:
+    if isinstance(_backend, RedisCache):
+        try:
+            return int(_backend.client.get(REDIS_PREFIX + name) or 0)
+        except Exception as e:
+            logger.warning("redis get %s failed: %s", name, e)
+    try:
+        with open(os.path.join(VERSION_DIR, name)) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_shared_version(name: str) -> None:
+    if isinstance(_backend, RedisCache):
+        try:
+            _backend.client.incr(REDIS_PREFIX + name)
+            return
+        except Exception as e:
+            logger.warning("redis incr %s failed: %s", name, e)
+    os.makedirs(VERSION_DIR, exist_ok=True)
+    with open(os.path.join(VERSION_DIR, name), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            version = int(f.read().strip() or 0) + 1
+        except ValueError:
+            version = 1
+        f.seek(0)
+        f.truncate()
+        f.write(str(version))
+
+
+def data_version() -> int:
+    return shared_version("data_version")
+
+
+def bump_data_version() -> None:
+    """เรียกหลัง commit ของงานที่เปลี่ยนข้อมูล → response ที่ cache ไว้ทั้งหมดหมดอายุ"""
+    bump_shared_version("data_version")
+
+
+# ---------------- Endpoint helpers ----------------
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _respond(request: Request, etag: str, body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}:
+        _not_modified.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def response_cache_key(request: Request) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"v{data_version()}:{request.url.path}?{query}"
+
+
+def cached_response(request: Request, key: str) -> Response | None:
+    hit = _backend.get(key)
+    if hit is None:
+        _misses.inc()
+        return None
+    _hits.inc()
+    return _respond(request, *hit)
+
+
+def store_response(request: Request, key: str, model: BaseModel) -> Response:
+    body = model.model_dump_json().encode()
+    etag = _etag(body)
+    _backend.set(key, (etag, body))
+    return _respond(request, etag, body)
+
+
+def _cache_metrics() -> dict:
+    return {
+        "backend": "redis" if isinstance(_backend, RedisCache) else "memory",
+        "entries": len(_backend),
+        "hits": _hits.value,
+        "misses": _misses.value,
+        "not_modified": _not_modified.value,
+        "data_version": data_version(),
+    }
+
+
+register_section("response_cache", _cache_metrics)
@@ -1,17 +1,182 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import os, time
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from .metrics import Timer, Counter, register_section
 
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL, future=True)
+
+# ---------------- Pool settings (env) ----------------
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))            # วินาทีที่รอ connection ว่างก่อน TimeoutError
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))            # วินาที; -1 = ไม่ recycle
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = ไม่จำกัด; ใช้กับ read API (async) เท่านั้น
+
+
+class PoolStats:
+	def __init__(self):
+		self.checkout_wait = Timer()   # เวลารอ connection จาก pool
+		self.hold = Timer()            # เวลาที่ connection ถูกยืมไปจนคืน
+		self.timeouts = Counter()
+
+
+SYNC_POOL_STATS = PoolStats()
+ASYNC_POOL_STATS = PoolStats()
+
+# เวลาที่ ORM query เริ่ม (ก่อนยืม connection) — event "checkout" ของ pool ใช้คำนวณเวลารอ
+_checkout_requested: ContextVar[float | None] = ContextVar("checkout_requested", default=None)
+
+
+def _pool_options(url: str, poolclass) -> dict:
+	if make_url(url).get_backend_name() == "sqlite":
+		return {}
+	return {
+		"poolclass": poolclass,
+		"pool_size": DB_POOL_SIZE,
+		"max_overflow": DB_MAX_OVERFLOW,
+		"pool_timeout": DB_POOL_TIMEOUT,
+		"pool_recycle": DB_POOL_RECYCLE,
+		"pool_pre_ping": DB_POOL_PRE_PING,
+	}
+
+
+def _track_pool(sync_engine, stats: PoolStats) -> None:
+	"""
+	ใช้เฉพาะ event สาธารณะของ pool (checkout/checkin):
+	- checkout_wait: ORM query เริ่ม (do_orm_execute) → ได้ connection (รวมเวลาเปิด connection ใหม่)
+	  checkout ที่ไม่ได้มาจาก ORM query (เช่น engine.begin() ของงาน ingest, flush ตอน commit) ไม่ถูกนับ
+	- hold: checkout → checkin
+	"""
+	@event.listens_for(sync_engine, "checkout")
+	def _on_checkout(dbapi_conn, record, proxy):
+		now = time.perf_counter()
+		requested = _checkout_requested.get()
+		if requested is not None:
+			_checkout_requested.set(None)
+			stats.checkout_wait.observe(now - requested)
+		record.info["checkout_at"] = now
+
+	@event.listens_for(sync_engine, "before_cursor_execute")
+	def _on_execute(conn, cursor, statement, parameters, context, executemany):
+		# query ที่ใช้ connection ที่ session ถืออยู่แล้วไม่ผ่าน checkout → ล้างจุดเริ่มที่ค้าง
+		_checkout_requested.set(None)
+
+	@event.listens_for(sync_engine, "checkin")
+	def _on_checkin(dbapi_conn, record):
+		t0 = record.info.pop("checkout_at", None)
+		if t0 is not None:
+			stats.hold.observe(time.perf_counter() - t0)
+
+
+engine = create_engine(DATABASE_URL, future=True, **_pool_options(DATABASE_URL, QueuePool))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 Base = declarative_base()
 
 
+def to_async_url(url: str) -> str:
+	# psycopg (v3) ใช้ได้ทั้ง sync/async → postgresql:// หรือ postgresql+psycopg2:// เปลี่ยนเป็น postgresql+psycopg://
+	u = make_url(url)
+	if u.get_backend_name() == "postgresql":
+		return u.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+	if u.get_backend_name() == "sqlite":
+		return u.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+	return url
+
+
+# read API (list_*) ใช้ AsyncSession เพื่อไม่ให้ query ที่ช้าบล็อก event loop
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+_async_connect_args = {}
+if DB_STATEMENT_TIMEOUT_MS > 0 and make_url(ASYNC_DATABASE_URL).get_backend_name() == "postgresql":
+	# ingest job (engine แบบ sync) มี statement ยาวโดยธรรมชาติ จึงจำกัดเฉพาะฝั่ง read API
+	_async_connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+async_engine = create_async_engine(
+	ASYNC_DATABASE_URL,
+	connect_args=_async_connect_args,
+	**_pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool),
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+_track_pool(engine, SYNC_POOL_STATS)
+_track_pool(async_engine.sync_engine, ASYNC_POOL_STATS)
+
+
+# ---------------- Session lifecycle ----------------
+# Session ยืม connection จาก pool ตอน query แรกเท่านั้น (lazy) — request ที่ไม่ query จึงไม่แตะ pool
+# after_begin บอกว่า session นั้นได้ใช้ connection จริงหรือไม่
+_session_opened = Counter()
+_session_used_connection = Counter()
+_session_duration = Timer()
+
+
+@event.listens_for(Session, "after_begin")
+def _on_session_begin(session, transaction, connection):
+	session.info["used_connection"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+	_checkout_requested.set(time.perf_counter())
+
+
+def _record_session(db, t0: float) -> None:
+	_session_duration.observe(time.perf_counter() - t0)
+	if db.info.pop("used_connection", False):
+		_session_used_connection.inc()
+
+
 def get_db():
 	db = SessionLocal()
+	_session_opened.inc()
+	t0 = time.perf_counter()
 	try:
 		yield db
+	except exc.TimeoutError:  # pool เต็มนานเกิน DB_POOL_TIMEOUT
+		SYNC_POOL_STATS.timeouts.inc()
+		raise
 	finally:
-		db.close()
\ No newline at end of file
+		db.close()
+		_record_session(db, t0)
+
+
+async def get_async_db():
+	_session_opened.inc()
+	t0 = time.perf_counter()
+	async with AsyncSessionLocal() as db:
+		try:
+			yield db
+		except exc.TimeoutError:
+			ASYNC_POOL_STATS.timeouts.inc()
+			raise
+		finally:
+			_record_session(db, t0)
+
+
+def _pool_section(pool, stats: PoolStats) -> dict:
+	out = {"status": pool.status()}
+	if isinstance(pool, QueuePool):
+		out.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(), overflow=pool.overflow())
+	out.update(checkout_wait=stats.checkout_wait.as_dict(), hold=stats.hold.as_dict(), timeouts=stats.timeouts.value)
+	return out
+
+
+def _db_metrics() -> dict:
+	return {
+		"pool": _pool_section(engine.pool, SYNC_POOL_STATS),
+		"async_pool": _pool_section(async_engine.sync_engine.pool, ASYNC_POOL_STATS),
+		"sessions": {
+			"opened": _session_opened.value,
+			"used_connection": _session_used_connection.value,
+			"no_connection": _session_duration.count - _session_used_connection.value,
+			"duration": _session_duration.as_dict(),
+		},
+	}
+
+
+register_section("db", _db_metrics)
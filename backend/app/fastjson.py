@@ -0,0 +1,26 @@
+"""
+fast path ของ list endpoint: Row จาก DB → dict → orjson bytes โดยไม่สร้าง Pydantic model ต่อแถว
+
+endpoint ยังประกาศ response_model เดิม (OpenAPI ใน schemas.py ไม่เปลี่ยน) แต่คืน Response ตรง ๆ
+FastAPI จึงไม่ validate/serialize ซ้ำอีกรอบ — ชื่อคอลัมน์ที่ select ต้องตรงกับ field ของ schema
+"""
+from __future__ import annotations
+from typing import Any, Sequence
+
+import orjson
+from fastapi import Response
+
+
+def rows_to_dicts(rows: Sequence, rename: dict[str, str] | None = None) -> list[dict[str, Any]]:
+    """แปลง Row (ผลของ select) เป็น dict โดยใช้ชื่อคอลัมน์/label เป็น key; rename เช่น {"pk_id": "id"}"""
+    if not rows:
+        return []
+    keys = list(rows[0]._fields)
+    if rename:
+        keys = [rename.get(k, k) for k in keys]
+    return [dict(zip(keys, r)) for r in rows]
+
+
+def json_response(payload: dict[str, Any], status_code: int = 200) -> Response:
+    # orjson รองรับ date/datetime/float/None โดยตรง (date → "YYYY-MM-DD" แบบเดียวกับ Pydantic)
+    return Response(content=orjson.dumps(payload), status_code=status_code, media_type="application/json")
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import os, logging, threading
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update, func
+
+from .database import SessionLocal, engine
+from .models import IngestJob
+from .utils import ingest_nc_north_adm2_to_db, ingest_dbf_to_db, ingest_excel_to_db
+
+
+logger = logging.getLogger("jobs")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+JOB_HEARTBEAT_SEC = float(os.getenv("JOB_HEARTBEAT_SEC", "30"))
+JOB_LEASE_SEC = float(os.getenv("JOB_LEASE_SEC", "120"))   # running ที่ไม่ต่อ heartbeat นานกว่านี้ = worker ตายแล้ว
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _update_job(job_id: int, only_if_state: str | None = None, **values) -> int:
+    """อัปเดตสถานะ job ด้วย connection แยก (ไม่ปนกับ transaction ของงาน ingest); only_if_state = อัปเดตเฉพาะ job ที่อยู่ใน state นี้"""
+    stmt = update(IngestJob).where(IngestJob.job_id == job_id)
+    if only_if_state is not None:
+        stmt = stmt.where(IngestJob.state == only_if_state)
+    with engine.begin() as conn:
+        res = conn.execute(stmt.values(**values))
+    return res.rowcount
+
+
+def _init_worker():
+    # process ลูกต้องไม่ใช้ connection ใน pool ที่สืบทอดมาจาก process แม่
+    engine.dispose(close=False)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _discard_executor(broken: ProcessPoolExecutor) -> None:
+    """worker ตาย (เช่น OOM) → pool ถูกตั้งเป็น broken ใช้ต่อไม่ได้อีก; ทิ้งไปให้ get_executor สร้างใหม่"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+            logger.warning("ingest process pool is broken, starting a new one")
+    broken.shutdown(wait=False)
+
+
+def submit_job(job_id: int, retry: bool = True) -> None:
+    executor = get_executor()
+    try:
+        future = executor.submit(run_job, job_id)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        if retry:
+            submit_job(job_id, retry=False)
+        else:
+            _update_job(job_id, state="failed", error="ingest worker pool unavailable", time_finish=_now())
+        return
+    future.add_done_callback(lambda f: _on_job_exit(job_id, executor, f))
+
+
+def _on_job_exit(job_id: int, executor: ProcessPoolExecutor, future: Future) -> None:
+    """
+    job ที่ค้างอยู่ใน pool ตอน worker ตายจะจบด้วย BrokenProcessPool:
+    - running: ตัวที่รันอยู่ตอน worker ตาย → failed (งานเขียนใน transaction เดียว จึงยังไม่มีอะไรลง DB)
+    - queued: ยังไม่ได้เริ่ม → ส่งเข้า pool ใหม่
+    """
+    if future.cancelled() or not isinstance(future.exception(), BrokenProcessPool):
+        return
+    _discard_executor(executor)
+    failed = _update_job(
+        job_id, only_if_state="running",
+        state="failed", error="ingest worker process died (e.g. out of memory)", time_finish=_now(),
+    )
+    if not failed:
+        submit_job(job_id)
+
+
+def _heartbeat(job_id: int, stop: threading.Event) -> None:
+    while not stop.wait(JOB_HEARTBEAT_SEC):
+        try:
+            _update_job(job_id, heartbeat_at=_now())
+        except Exception as e:
+            logger.warning("heartbeat of job %s failed: %s", job_id, e)
+
+
+def run_job(job_id: int) -> None:
+    """รันใน worker process: claim job (queued → running) แล้วเรียก ingest ตาม kind"""
+    with engine.begin() as conn:
+        now = _now()
+        claimed = conn.execute(
+            update(IngestJob)
+            .where(IngestJob.job_id == job_id, IngestJob.state == "queued")
+            .values(state="running", time_start=now, heartbeat_at=now, error=None)
+        ).rowcount
+    if claimed != 1:
+        return
+
+    # ต่ออายุ lease ระหว่างรัน → process อื่นที่ startup จะไม่ดึงงานนี้ไปรันซ้ำ (resume_pending_jobs)
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop), daemon=True).start()
+
+    db = SessionLocal()
+    try:
+        job = db.get(IngestJob, job_id)
+        params = job.params or {}
+
+        def progress(rows_written: int, steps_done: int, steps_total: int) -> None:
+            _update_job(job_id, rows_written=rows_written, steps_done=steps_done, steps_total=steps_total)
+
+        if job.kind == "netcdf":
+            result = ingest_nc_north_adm2_to_db(
+                engine=db,
+                upload_id=job.upload_id,
+                nc_path=job.storage_path,
+                adm2_shp_path=params["adm2_shp_path"],
+                progress=progress,
+                incremental=params.get("incremental"),
+            )
+            total = result["rows_inserted"] + result["rows_updated"]
+        elif job.kind == "dbf":
+            total = ingest_dbf_to_db(
+                engine=db,
+                upload_risk_id=job.upload_risk_id,
+                raw_path=job.storage_path,
+                special_fix=bool(params.get("special_fix")),
+                aggregation=params.get("aggregation", "mean"),
+                shp_path=params.get("shp_path"),
+                adm2_shp_path=params.get("adm2_shp_path"),
+            )
+            result = {"rows_inserted": total}
+        elif job.kind == "excel":
+            result = ingest_excel_to_db(
+                engine=db,
+                xlsx_path=job.storage_path,
+            )
+            total = result["rows_inserted"] + result["rows_updated"]
+        else:
+            raise ValueError(f"unknown job kind: {job.kind}")
+
+        done = {"state": "done", "rows_written": total, "result": result, "time_finish": _now()}
+        if job.kind != "netcdf":
+            done.update(steps_done=1, steps_total=1)
+        _update_job(job_id, **done)
+    except Exception as e:
+        logger.exception("ingest job %s failed: %s", job_id, e)
+        db.rollback()
+        detail = getattr(e, "detail", None) or str(e)
+        _update_job(job_id, state="failed", error=str(detail), time_finish=_now())
+    finally:
+        stop.set()
+        db.close()
+
+
+def resume_pending_jobs() -> int:
+    """
+    เรียกตอน startup: งานที่ค้าง (queued/running) ถูกส่งเข้า pool ใหม่
+    - running: ดึงคืนเฉพาะงานที่ heartbeat ขาดเกิน JOB_LEASE_SEC (worker ตายแล้ว) — หลาย uvicorn worker/replica
+      start พร้อมกันได้โดยไม่ไปแย่งงานที่ process อื่นยังรันอยู่
+    - queued: ส่งซ้ำจากหลาย process ได้ เพราะ run_job claim (queued → running) แบบ atomic
+    งาน ingest เขียนใน transaction เดียว งานที่ worker ตายกลางทางจึงยังไม่ได้เขียนอะไรลง DB
+    """
+    lease_expired = _now() - timedelta(seconds=JOB_LEASE_SEC)
+    with engine.begin() as conn:
+        reclaimed = conn.execute(
+            update(IngestJob)
+            .where(
+                IngestJob.state == "running",
+                func.coalesce(IngestJob.heartbeat_at, IngestJob.time_start, IngestJob.time_create) < lease_expired,
+            )
+            .values(state="queued", rows_written=0, steps_done=0)
+        ).rowcount
+    if reclaimed:
+        logger.info("reclaimed %d ingest jobs with an expired lease", reclaimed)
+    db = SessionLocal()
+    try:
+        job_ids = [j for (j,) in db.query(IngestJob.job_id).filter(IngestJob.state == "queued").order_by(IngestJob.job_id)]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        submit_job(job_id)
+    return len(job_ids)
@@ -1,29 +1,35 @@
 # backend/app/main.py
 from __future__ import annotations
-import os, uuid, logging, io
+import os, uuid, logging, io, json, base64
 from typing import Optional
 
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Response, Query
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Response, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date
 import pandas as pd
-from sqlalchemy import select, func, asc, desc, and_, or_
-from .database import Base, engine, get_db
-from .models import User, UploadRainPoint, RainPoint, Province, District, UploadRisk, RiskPoint, IncidentStatisticsPoint
-from .schemas import UserOut, RegisterIn, LoginIn, ListPaginationOut, ListProvinceDistrictPaginationOut, RainPointOut, ProvinceOut, DistrictOut, ProvinceListOut, DistrictListOut, ProvinceDistrictPointOut, RiskPointOut, ListRiskPaginationOut, IncidentStatisticsPointOut, ListIncidentStatisticsPaginationOut, DateLimitOut, GraphPointOut, ListGraphOut
+from sqlalchemy import select, func, asc, desc, and_, or_, tuple_, text
+from .database import Base, engine, get_db, get_async_db
+from .models import User, UploadRainPoint, RainPoint, Province, District, UploadRisk, RiskPoint, IncidentStatisticsPoint, IngestJob, DailyDistrictSummary
+from .schemas import UserOut, RegisterIn, LoginIn, ListPaginationOut, ListProvinceDistrictPaginationOut, RainPointOut, ProvinceOut, DistrictOut, ProvinceListOut, DistrictListOut, ProvinceDistrictPointOut, RiskPointOut, ListRiskPaginationOut, IncidentStatisticsPointOut, ListIncidentStatisticsPaginationOut, DateLimitOut, GraphPointOut, ListGraphOut, JobOut, JobSubmitOut
 from .auth import (
-    hash_password, verify_password,
+    hash_password, verify_and_update,
     create_access_token, set_auth_cookie, clear_auth_cookie,
     get_current_user
 )
-from .utils import (
-    init_data,
-    ingest_nc_north_adm2_to_db,
-    ingest_dbf_to_db,
-    ingest_excel_to_db
-)
+from .utils import init_data
+from .jobs import submit_job, resume_pending_jobs
+from .summary import ensure_daily_summary
+from .migrations import run_migrations
+from .metrics import collect_metrics
+from .cache import response_cache_key, cached_response, store_response
+from .export import stream_arrow, RAIN_EXPORT_SCHEMA, EXPORT_FORMATS
+from .fastjson import rows_to_dicts, json_response
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 # ---------------- App & CORS ----------------
 app = FastAPI(title="Landslide Ingest API", version="1.0.0")
 
@@ -52,6 +58,86 @@ MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "4096"))
 MAX_BYTES = MAX_UPLOAD_MB * 1024 * 1024
 
 
+@app.on_event("startup")
+def build_daily_summary():
+    ensure_daily_summary(engine)
+
+
+@app.on_event("startup")
+def resume_jobs():
+    resumed = resume_pending_jobs()
+    if resumed:
+        logger.info("resumed %d pending ingest jobs", resumed)
+
+
+# ---------------- Pagination helpers ----------------
+def encode_cursor(order_by: str, value, pk: int) -> str:
+    """cursor แบบ opaque = base64(json[order_by, ค่า sort key ของแถวสุดท้าย, pk])"""
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([order_by, value, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, order_by: str, date_fields: set[str]) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor_order_by, value, pk = json.loads(raw)
+        if cursor_order_by != order_by:
+            raise ValueError("order_by mismatch")
+        if order_by in date_fields and value is not None:
+            value = date.fromisoformat(value)
+        return value, int(pk)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+def keyset_after(column, pk_column, value, pk: int, order_type: str):
+    """เงื่อนไข (sort key, pk) > / < (value, pk) ของแถวสุดท้ายในหน้าก่อน (แถวที่ sort key เป็น NULL จะไม่ถูกนับ)"""
+    if order_type.lower() == "asc":
+        return tuple_(column, pk_column) > tuple_(value, pk)
+    return tuple_(column, pk_column) < tuple_(value, pk)
+
+
+async def count_rows(db: AsyncSession, pk_column, conds: list, mode: str) -> Optional[int]:
+    """
+    mode = exact    → count(*) ตามเดิม
+           estimate → ใช้จำนวนแถวที่ planner ประมาณ (Postgres) ไม่ต้องสแกนจริง
+           none     → ไม่นับ
+    """
+    if mode == "none":
+        return None
+
+    base_stmt = select(pk_column)
+    if conds:
+        base_stmt = base_stmt.where(and_(*conds))
+
+    if mode == "estimate" and db.bind.dialect.name == "postgresql":
+        compiled = base_stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+        plan = (await db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    count_stmt = select(func.count()).select_from(base_stmt.subquery())
+    return (await db.execute(count_stmt)).scalar_one()
+
+
+def rain_filters(province_id: str, district_id: str, date_start: Optional[date], date_end: Optional[date]) -> list:
+    conds = []
+    if province_id != 'all' :
+        conds.append(RainPoint.province_id == int(province_id))
+
+    if district_id != 'all' :
+        conds.append(RainPoint.district_id == int(district_id))
+
+    if date_start is not None and date_start != 'null':
+        conds.append(RainPoint.date >= date_start)
+    
+    if date_end is not None and date_end != 'null':
+        conds.append(RainPoint.date <= date_end)
+    return conds
+
 
 # ---------------- Middleware (optional debug) ----------------
 @app.middleware("http")
@@ -62,20 +148,31 @@ async def log_requests(request, call_next):
     return resp
 
 
+@app.get("/metrics")
+def metrics():
+    return collect_metrics()
+
+
 # ---------------- Auth Endpoints ----------------
 @app.post("/auth/register", response_model=UserOut)
-def register(data: RegisterIn, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.username == data.username).first():
+async def register(data: RegisterIn, db: AsyncSession = Depends(get_async_db)):
+    if (await db.execute(select(User.user_id).where(User.username == data.username))).first():
         raise HTTPException(400, "Username already registered")
-    user = User(username=data.username, full_name=data.full_name, password_hash=hash_password(data.password))
-    db.add(user); db.commit(); db.refresh(user)
+    user = User(username=data.username, full_name=data.full_name, password_hash=await hash_password(data.password))
+    db.add(user); await db.commit(); await db.refresh(user)
     return user
 
 @app.post("/auth/login", response_model=UserOut)
-def login(data: LoginIn, response: Response, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == data.username).first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def login(data: LoginIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.username == data.username))).scalars().first()
+    if not user:
+        raise HTTPException(401, "Invalid Username or password")
+    valid, new_hash = await verify_and_update(data.password, user.password_hash)
+    if not valid:
         raise HTTPException(401, "Invalid Username or password")
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit(); await db.refresh(user)
     token = create_access_token(sub=user.username, extra={"uid": user.user_id})
     set_auth_cookie(response, token)
     return user
@@ -105,10 +202,39 @@ def init_data_province_district(db: Session = Depends(get_db)):
     
     return 'ok'
 
+# ---------------- Upload helper ----------------
+async def save_upload(file: UploadFile, path: str) -> int:
+    """เขียนไฟล์ที่อัปโหลดลง path ทีละ 1 MB → จำนวน byte (เกิน MAX_BYTES → 413 และลบไฟล์ทิ้ง)"""
+    written = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk: break
+            written += len(chunk)
+            if written > MAX_BYTES:
+                f.close()
+                try: os.remove(path)
+                except: pass
+                raise HTTPException(413, f"File too large (> {MAX_UPLOAD_MB} MB)")
+            f.write(chunk)
+    return written
+
+def _save_row(db: Session, row):
+    db.add(row); db.commit(); db.refresh(row)
+    return row
+
+
+def _queue_job(db: Session, job: IngestJob) -> JobSubmitOut:
+    """บันทึก job แล้วส่งเข้า pool ของ ingest — เป็น blocking call จึงเรียกผ่าน run_in_threadpool จาก handler async"""
+    _save_row(db, job)
+    submit_job(job.job_id)
+    return JobSubmitOut(job_id=job.job_id, state=job.state)
+
 # ---------------- Upload NetCDF ----------------
-@app.post("/upload")
+@app.post("/upload", response_model=JobSubmitOut)
 async def upload_netcdf(
     file: UploadFile = File(...),
+    full_reload: Optional[bool] = Form(None, description="true = ประมวลผลทุกวันในไฟล์, false = เฉพาะวันที่ใหม่กว่าที่มีใน DB; ค่าเริ่มต้นตาม NC_INCREMENTAL"),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -120,40 +246,25 @@ async def upload_netcdf(
     safe_name = f"{uuid.uuid4().hex}_RAW_{os.path.basename(file.filename)}"
     raw_path = os.path.join(STORAGE_DIR, safe_name)
 
-    written = 0
-    with open(raw_path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk: break
-            written += len(chunk)
-            if written > MAX_BYTES:
-                f.close()
-                try: os.remove(raw_path)
-                except: pass
-                raise HTTPException(413, f"File too large (> {MAX_UPLOAD_MB} MB)")
-            f.write(chunk)
+    written = await save_upload(file, raw_path)
 
-    row = UploadRainPoint(
+    row = await run_in_threadpool(_save_row, db, UploadRainPoint(
         filename=file.filename,
         storage_path=raw_path,
         size_bytes=written,
         content_type=file.content_type or "application/x-netcdf",
         owner_id=user.user_id,
-    )
-    db.add(row); db.commit(); db.refresh(row)
-    try:
-        total = ingest_nc_north_adm2_to_db(
-            engine=db,
-            upload_id=row.upload_id,
-            nc_path=raw_path,
-            adm2_shp_path=PROV_BOUNDARY,
-        )
-    except Exception as e:
-        logger.exception("ingest failed: %s", e)
-        raise HTTPException(400, f"Ingest failed: {e}")
+    ))
 
-    # os.remove(raw_path)
-    return {"rows_inserted": total}
+    job = IngestJob(
+        kind="netcdf",
+        storage_path=raw_path,
+        # ไม่ส่ง full_reload → incremental=None ใช้ค่า NC_INCREMENTAL ของ worker
+        params={"adm2_shp_path": PROV_BOUNDARY, "incremental": None if full_reload is None else not full_reload},
+        upload_id=row.upload_id,
+        owner_id=user.user_id,
+    )
+    return await run_in_threadpool(_queue_job, db, job)
 
 # @app.get("/test_upload")
 # async def test_upload(
@@ -173,7 +284,11 @@ async def upload_netcdf(
 
 
 @app.get("/list_province", response_model=ProvinceListOut)
-async def list_province(db: Session = Depends(get_db)):
+async def list_province(request: Request, db: AsyncSession = Depends(get_async_db)):
+    cache_key = response_cache_key(request)
+    if (hit := cached_response(request, cache_key)) is not None:
+        return hit
+
     stmt = (
         select(
             Province.province_id,
@@ -183,7 +298,7 @@ async def list_province(db: Session = Depends(get_db)):
         .order_by(Province.province_id.asc())
     )
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
     items = [
         ProvinceOut(
             province_id=r.province_id,
@@ -193,16 +308,21 @@ async def list_province(db: Session = Depends(get_db)):
         for r in rows
     ]
 
-    return ProvinceListOut(
+    return store_response(request, cache_key, ProvinceListOut(
         total=len(items),
         items=items
-    ) 
+    ))
 
 @app.get("/list_district", response_model=DistrictListOut)
 async def list_district(
+    request: Request,
     province_id: Optional[str] = Query('all', description='เช่น "all" หรือ "50" หรือ "50,51"'),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    cache_key = response_cache_key(request)
+    if (hit := cached_response(request, cache_key)) is not None:
+        return hit
+
     conds = []
     if province_id != 'all' :
         conds.append(District.province_id == int(province_id))
@@ -219,7 +339,7 @@ async def list_district(
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
 
     items = [
         DistrictOut(
@@ -230,10 +350,10 @@ async def list_district(
         for r in rows
     ]
 
-    return DistrictListOut(
+    return store_response(request, cache_key, DistrictListOut(
         total=len(items),
         items=items
-    ) 
+    ))
 
 
 @app.get("/list_rain", response_model=ListPaginationOut)
@@ -246,29 +366,17 @@ async def list_rain(
     district_id: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
     date_start: Optional[date] = Query(None, description='เช่น "all" หรือ "2024-05-03"'),
     date_end: Optional[date] = Query(None, description='เช่น "all" หรือ "2024-05-03"'),
-    db: Session = Depends(get_db),
+    after: Optional[str] = Query(None, description="next_cursor จากหน้าก่อน (keyset pagination แทน page)"),
+    count: str = Query("exact", regex="^(exact|estimate|none)$", description="วิธีนับ total"),
+    db: AsyncSession = Depends(get_async_db),
 ):
     
-    conds = []
-    if province_id != 'all' :
-        conds.append(RainPoint.province_id == int(province_id))
+    conds = rain_filters(province_id, district_id, date_start, date_end)
 
-    if district_id != 'all' :
-        conds.append(RainPoint.district_id == int(district_id))
-
-    if date_start is not None and date_start != 'null':
-        conds.append(RainPoint.date >= date_start)
-    
-    if date_end is not None and date_end != 'null':
-        conds.append(RainPoint.date <= date_end)
-
-
-    count_stmt = select(func.count(RainPoint.pk_id)).select_from(RainPoint)
-    if conds:
-        count_stmt = count_stmt.where(and_(*conds))
-    total = db.execute(count_stmt).scalar_one()
-    all_page = max((total + page_size - 1) // page_size, 1)
-    page = min(page, all_page)
+    total = await count_rows(db, RainPoint.pk_id, conds, count)
+    all_page = max((total + page_size - 1) // page_size, 1) if total is not None else None
+    if all_page is not None:
+        page = min(page, all_page)
 
     P = aliased(Province)
     D = aliased(District)
@@ -280,7 +388,9 @@ async def list_rain(
         "district_name": D.district_name,
     }
 
-    column = sortable_fields.get(order_by, RainPoint.date)  # fallback = date
+    if order_by not in sortable_fields:
+        order_by = "date"  # fallback = date
+    column = sortable_fields[order_by]
     direction = asc if order_type.lower() == "asc" else desc
     stmt = (
         select(
@@ -296,37 +406,73 @@ async def list_rain(
         )
         .join(P, P.province_id == RainPoint.province_id, isouter=True)
         .join(D, D.district_id == RainPoint.district_id, isouter=True)
-        .order_by(direction(column))
-        .offset((page - 1) * page_size)
+        .order_by(direction(column), direction(RainPoint.pk_id))
         .limit(page_size)
     )
 
+    if after:
+        value, pk = decode_cursor(after, order_by, {"date"})
+        conds.append(keyset_after(column, RainPoint.pk_id, value, pk, order_type))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
 
-    items = [
-        RainPointOut(
-            id=r.pk_id,
-            date=r.date,
-            rain_mm_wmean=r.rain_mm_wmean,
-            province_id=r.province_id,
-            district_id=r.district_id,
-            province_name=r.province_name,
-            province_name_en=r.province_name_en,
-            district_name=r.district_name,
-            district_name_en=r.district_name_en,
+    items = rows_to_dicts(rows, {"pk_id": "id"})
+
+    next_cursor = None
+    if len(rows) == page_size:
+        last = rows[-1]
+        next_cursor = encode_cursor(order_by, getattr(last, order_by), last.pk_id)
+
+    return json_response({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "all_page": all_page,
+        "next_cursor": next_cursor,
+        "items": items,
+    })
+
+
+@app.get("/export/rain")
+def export_rain(
+    format: str = Query("parquet", regex="^(parquet|arrow)$", description="parquet หรือ arrow (Arrow IPC stream)"),
+    province_id: Optional[str] = Query('all', description='เช่น "all" หรือ "50"'),
+    district_id: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
+    date_start: Optional[date] = Query(None, description='เช่น "2024-05-03"'),
+    date_end: Optional[date] = Query(None, description='เช่น "2024-05-03"'),
+    user: User = Depends(get_current_user),
+):
+    conds = rain_filters(province_id, district_id, date_start, date_end)
+    stmt = (
+        select(
+            RainPoint.date,
+            RainPoint.year,
+            RainPoint.province_id,
+            Province.province_name,
+            Province.province_name_en,
+            RainPoint.district_id,
+            District.district_name,
+            District.district_name_en,
+            RainPoint.rain_mm_wmean,
+            RainPoint.rainfall_mm,
         )
-        for r in rows
-    ]
+        .join(Province, Province.province_id == RainPoint.province_id, isouter=True)
+        .join(District, District.district_id == RainPoint.district_id, isouter=True)
+        .order_by(RainPoint.date.asc(), RainPoint.district_id.asc())
+    )
+    if conds:
+        stmt = stmt.where(and_(*conds))
 
-    return ListPaginationOut(
-        page=page,
-        page_size=page_size,
-        total=total,
-        all_page=all_page,
-        items=items,
+    media_type, ext = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_arrow(engine, stmt, RAIN_EXPORT_SCHEMA, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="rain_points.{ext}"'},
     )
 
 
@@ -338,7 +484,7 @@ async def list_province_district(
     order_type: str = Query("asc", regex="^(asc|desc)$", description="ทิศทาง asc/desc"),
     province_id: Optional[str] = Query('all', description='เช่น "all" หรือ "50" หรือ "50,51"'),
     district_id: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     
     P = aliased(Province)
@@ -355,7 +501,7 @@ async def list_province_district(
     count_stmt = select(func.count(D.district_id)).select_from(D)
     if conds:
         count_stmt = count_stmt.where(and_(*conds))
-    total = db.execute(count_stmt).scalar_one()
+    total = (await db.execute(count_stmt)).scalar_one()
     all_page = max((total + page_size - 1) // page_size, 1)
     page = min(page, all_page)
 
@@ -386,80 +532,92 @@ async def list_province_district(
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
 
-    items = [
-        ProvinceDistrictPointOut(
-            province_id=r.province_id,
-            district_id=r.district_id,
-            province_name=r.province_name,
-            province_name_en=r.province_name_en,
-            district_name=r.district_name,
-            district_name_en=r.district_name_en,
-        )
-        for r in rows
-    ]
+    items = rows_to_dicts(rows)
 
-    return ListProvinceDistrictPaginationOut(
-        page=page,
-        page_size=page_size,
-        total=total,
-        all_page=all_page,
-        items=items,
-    )
+    return json_response({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "all_page": all_page,
+        "items": items,
+    })
 
 
-@app.post("/upload_dbf")
+@app.post("/upload_dbf", response_model=JobSubmitOut)
 async def upload_dbf(
     file: UploadFile = File(...),
+    shp: Optional[UploadFile] = File(None, description=".shp ของชั้นข้อมูลเดียวกัน (ใช้กับ aggregation=area)"),
+    shx: Optional[UploadFile] = File(None),
+    prj: Optional[UploadFile] = File(None, description="ไม่ส่ง → ถือว่าเป็น RISK_DEFAULT_CRS"),
+    aggregation: Optional[str] = Form(None, description='"mean" (เฉลี่ยต่อ record) หรือ "area" (ถ่วงพื้นที่); ค่าเริ่มต้น area ถ้าส่ง .shp มา'),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    
+    """
+    อัปโหลดชั้นข้อมูลพื้นที่เสี่ยงดินถล่ม → job คำนวณ risk_level รายอำเภอ
+
+    - **mean**: เฉลี่ย class ของทุก record จับคู่อำเภอด้วยคอลัมน์ชื่อไทย amphoe_t / prov_nam_t ใน DBF
+      (ไฟล์ landslide_utt.dbf ใช้ special_fix แก้ชื่อจังหวัดเป็นอุตรดิตถ์)
+    - **area**: ค่าเฉลี่ย class ถ่วงด้วยพื้นที่ที่ polygon ซ้อนทับกับขอบเขตอำเภอ (ADM2) ใช้เฉพาะคอลัมน์ class + geometry
+      — ไม่อ่านคอลัมน์ชื่อไทย และไม่ใช้ special_fix
+    - ทั้งสองแบบ: อำเภอที่ไม่มีข้อมูลในไฟล์ แต่อยู่ในจังหวัดที่ไฟล์ครอบคลุม ได้ risk_level = 1
+      (area: จังหวัดที่มี polygon ซ้อนทับอย่างน้อยหนึ่งอำเภอ)
+    """
     if not (file.filename.endswith(".dbf")):
         raise HTTPException(400, "Please upload a .dbf file")
 
+    aggregation = aggregation or ("area" if shp is not None else "mean")
+    if aggregation not in ("mean", "area"):
+        raise HTTPException(400, 'aggregation must be "mean" or "area"')
+    if aggregation == "area":
+        if shp is None or shx is None:
+            raise HTTPException(400, "aggregation=area requires the .shp and .shx files")
+        if not os.path.exists(PROV_BOUNDARY):
+            raise HTTPException(400, f"Province boundary file not found: {PROV_BOUNDARY}")
+
     safe_name = f"{uuid.uuid4().hex}_RAW_{os.path.basename(file.filename)}"
     raw_path = os.path.join(STORAGE_DIR, safe_name)
 
-    written = 0
-    with open(raw_path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk: break
-            written += len(chunk)
-            if written > MAX_BYTES:
-                f.close()
-                try: os.remove(raw_path)
-                except: pass
-                raise HTTPException(413, f"File too large (> {MAX_UPLOAD_MB} MB)")
-            f.write(chunk)
+    written = await save_upload(file, raw_path)
+
+    # .shp/.shx/.prj ต้องชื่อเดียวกับ .dbf ถึงจะอ่านเป็นชั้นข้อมูลเดียวกันได้
+    shp_path = None
+    if aggregation == "area":
+        stem = os.path.splitext(raw_path)[0]
+        for part, ext in ((shp, ".shp"), (shx, ".shx"), (prj, ".prj")):
+            if part is not None:
+                written += await save_upload(part, stem + ext)
+        shp_path = stem + ".shp"
 
-    row = UploadRisk(
+    row = await run_in_threadpool(_save_row, db, UploadRisk(
         filename=file.filename,
         storage_path=raw_path,
         size_bytes=written,
         content_type=file.content_type,
         owner_id=user.user_id,
-    )
-    db.add(row); db.commit(); db.refresh(row)
+    ))
 
     special_fix = False
     if(file.filename == 'landslide_utt.dbf'):
         special_fix = True
-    try:
-        total = ingest_dbf_to_db(
-            engine=db,
-            upload_risk_id=row.upload_risk_id,
-            raw_path=raw_path,
-            special_fix=special_fix
-        )
-    except Exception as e:
-        logger.exception("ingest failed: %s", e)
-        raise HTTPException(400, f"Ingest failed: {e}")
+        if aggregation == "area":
+            logger.info("special_fix is ignored for aggregation=area (districts come from geometry)")
 
-    # os.remove(raw_path)
-    return {"rows_inserted": total}
+    job = IngestJob(
+        kind="dbf",
+        storage_path=raw_path,
+        params={
+            "special_fix": special_fix,
+            "aggregation": aggregation,
+            "shp_path": shp_path,
+            "adm2_shp_path": PROV_BOUNDARY,
+        },
+        upload_risk_id=row.upload_risk_id,
+        owner_id=user.user_id,
+    )
+    return await run_in_threadpool(_queue_job, db, job)
 
 @app.get("/list_risk", response_model=ListRiskPaginationOut)
 async def list_risk(
@@ -470,7 +628,7 @@ async def list_risk(
     province_id: Optional[str] = Query('all', description='เช่น "all" หรือ "50" หรือ "50,51"'),
     district_id: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
     risk_level: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     
     conds = []
@@ -487,7 +645,7 @@ async def list_risk(
     count_stmt = select(func.count(RiskPoint.risk_id)).select_from(RiskPoint)
     if conds:
         count_stmt = count_stmt.where(and_(*conds))
-    total = db.execute(count_stmt).scalar_one()
+    total = (await db.execute(count_stmt)).scalar_one()
     all_page = max((total + page_size - 1) // page_size, 1)
     page = min(page, all_page)
 
@@ -523,47 +681,48 @@ async def list_risk(
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
 
-    items = [
-        RiskPointOut(
-            id=r.risk_id,
-            risk_level=r.risk_level,
-            province_id=r.province_id,
-            district_id=r.district_id,
-            province_name=r.province_name,
-            province_name_en=r.province_name_en,
-            district_name=r.district_name,
-            district_name_en=r.district_name_en,
-        )
-        for r in rows
-    ]
+    items = rows_to_dicts(rows, {"risk_id": "id"})
 
-    return ListRiskPaginationOut(
-        page=page,
-        page_size=page_size,
-        total=total,
-        all_page=all_page,
-        items=items,
-    )
+    return json_response({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "all_page": all_page,
+        "items": items,
+    })
 
 
-@app.post("/upload_excel")
+@app.post("/upload_excel", response_model=JobSubmitOut)
 async def upload_excel(
     file: UploadFile = File(...),
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     
     if not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(status_code=400, detail="กรุณาอัปโหลดไฟล์ .xlsx หรือ .xls")
-    try:
-        result = await ingest_excel_to_db(
-            engine=db,
-            file=file,
-        )
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=422, detail=f"อ่านไฟล์ไม่สำเร็จ: {e}")
+
+    safe_name = f"{uuid.uuid4().hex}_RAW_{os.path.basename(file.filename)}"
+    raw_path = os.path.join(STORAGE_DIR, safe_name)
+
+    await save_upload(file, raw_path)
+
+    job = IngestJob(kind="excel", storage_path=raw_path, owner_id=user.user_id)
+    return await run_in_threadpool(_queue_job, db, job)
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: int,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = db.get(IngestJob, job_id)
+    # job ของผู้ใช้อื่นตอบ 404 เหมือนไม่มี (ไม่เปิดเผย storage_path / error)
+    if job is None or job.owner_id != user.user_id:
+        raise HTTPException(404, "Job not found")
+    return job
 
 @app.get("/list_incident_statistics", response_model=ListIncidentStatisticsPaginationOut)
 async def list_incident_statistics(
@@ -575,7 +734,9 @@ async def list_incident_statistics(
     district_id: Optional[str] = Query('all', description='เช่น "all" หรือ "12"'),
     date_start: Optional[date] = Query(None, description='เช่น "all" หรือ "2024-05-03"'),
     date_end: Optional[date] = Query(None, description='เช่น "all" หรือ "2024-05-03"'),
-    db: Session = Depends(get_db),
+    after: Optional[str] = Query(None, description="next_cursor จากหน้าก่อน (keyset pagination แทน page)"),
+    count: str = Query("exact", regex="^(exact|estimate|none)$", description="วิธีนับ total"),
+    db: AsyncSession = Depends(get_async_db),
 ):
     
         
@@ -594,12 +755,10 @@ async def list_incident_statistics(
         conds.append(IncidentStatisticsPoint.disaster_date <= date_end)
 
 
-    count_stmt = select(func.count(IncidentStatisticsPoint.incident_id)).select_from(IncidentStatisticsPoint)
-    if conds:
-        count_stmt = count_stmt.where(and_(*conds))
-    total = db.execute(count_stmt).scalar_one()
-    all_page = max((total + page_size - 1) // page_size, 1)
-    page = min(page, all_page)
+    total = await count_rows(db, IncidentStatisticsPoint.incident_id, conds, count)
+    all_page = max((total + page_size - 1) // page_size, 1) if total is not None else None
+    if all_page is not None:
+        page = min(page, all_page)
 
     P = aliased(Province)
     D = aliased(District)
@@ -609,9 +768,12 @@ async def list_incident_statistics(
         "count_of_disasters": IncidentStatisticsPoint.count_of_disasters,
         "province_name": P.province_name,
         "district_name": D.district_name,
+        "province_id": D.province_id,
     }
 
-    column = sortable_fields.get(order_by, D.province_id)
+    if order_by not in sortable_fields:
+        order_by = "province_id"
+    column = sortable_fields[order_by]
     direction = asc if order_type.lower() == "asc" else desc
     stmt = (
         select(
@@ -627,44 +789,46 @@ async def list_incident_statistics(
         )
         .join(P, P.province_id == IncidentStatisticsPoint.province_id, isouter=True)
         .join(D, D.district_id == IncidentStatisticsPoint.district_id, isouter=True)
-        .order_by(direction(column))
-        .offset((page - 1) * page_size)
+        .order_by(direction(column), direction(IncidentStatisticsPoint.incident_id))
         .limit(page_size)
     )
 
+    if after:
+        value, pk = decode_cursor(after, order_by, {"disaster_date"})
+        conds.append(keyset_after(column, IncidentStatisticsPoint.incident_id, value, pk, order_type))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    rows = db.execute(stmt).all()
+    rows = (await db.execute(stmt)).all()
 
-    items = [
-        IncidentStatisticsPointOut(
-            id=r.incident_id,
-            disaster_date=r.disaster_date,
-            count_of_disasters=r.count_of_disasters,
-            province_id=r.province_id,
-            district_id=r.district_id,
-            province_name=r.province_name,
-            province_name_en=r.province_name_en,
-            district_name=r.district_name,
-            district_name_en=r.district_name_en,
-        )
-        for r in rows
-    ]
-    	
-
-    return ListIncidentStatisticsPaginationOut(
-        page=page,
-        page_size=page_size,
-        total=total,
-        all_page=all_page,
-        items=items,
-    )
+    items = rows_to_dicts(rows, {"incident_id": "id"})
+
+    next_cursor = None
+    if len(rows) == page_size:
+        last = rows[-1]
+        next_cursor = encode_cursor(order_by, getattr(last, order_by), last.incident_id)
+
+    return json_response({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "all_page": all_page,
+        "next_cursor": next_cursor,
+        "items": items,
+    })
 
 @app.get("/get_date_limit", response_model=DateLimitOut)
 async def get_date_limit(
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
+    cache_key = response_cache_key(request)
+    if (hit := cached_response(request, cache_key)) is not None:
+        return hit
+
     stmt = (
         select(
             func.max(RainPoint.date),
@@ -672,61 +836,45 @@ async def get_date_limit(
         )
     )
 
-    result = db.execute(stmt).one()
+    result = (await db.execute(stmt)).one()
     max_date, min_date = result
-    return DateLimitOut(
+    return store_response(request, cache_key, DateLimitOut(
         min_date = min_date,
         max_date = max_date
-    )
+    ))
 
 @app.get("/list_data_graph", response_model=ListGraphOut)
 async def list_data_graph(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     date_filter: Optional[date] = Query(None, description='เช่น "all" หรือ "2024-05-03"'),
 ):
     
     P = aliased(Province)
     D = aliased(District)
-    R = aliased(RiskPoint)
-    I = aliased(IncidentStatisticsPoint)
-    
+    S = aliased(DailyDistrictSummary)
+
+    # ตารางสรุปรายวัน (PK date, district_id) → lookup ตามวันที่ครั้งเดียว
     stmt = (
         select(
-            RainPoint.date,
-            RainPoint.rain_mm_wmean,
-            RainPoint.province_id,
-            RainPoint.district_id,
+            S.date,
+            S.rain_mm_wmean,
+            S.province_id,
+            S.district_id,
             P.province_name.label("province_name"),
             P.province_name_en.label("province_name_en"),
             D.district_name.label("district_name"),
             D.district_name_en.label("district_name_en"),
-            R.risk_level.label("risk_level"),
-            func.coalesce(I.count_of_disasters, 0).label("count_of_disasters")
+            S.risk_level.label("risk_level"),  # NULL = ยังไม่มีข้อมูลความเสี่ยงของอำเภอนี้
+            S.count_of_disasters.label("count_of_disasters")
         )
-        .join(P, P.province_id == RainPoint.province_id, isouter=True)
-        .join(D, D.district_id == RainPoint.district_id, isouter=True)
-        .join(R, R.district_id == RainPoint.district_id, isouter=True)
-        .join(I, (I.district_id == RainPoint.district_id) & (I.disaster_date == date_filter), isouter=True)
-        .where(RainPoint.date == date_filter)
+        .join(P, P.province_id == S.province_id, isouter=True)
+        .join(D, D.district_id == S.district_id, isouter=True)
+        .where(S.date == date_filter)
     )
 
-    rows = db.execute(stmt).all()
-    items = [
-        GraphPointOut(
-            date=r.date,
-            rain_mm_wmean=r.rain_mm_wmean,
-            province_id=r.province_id,
-            district_id=r.district_id,
-            province_name=r.province_name,
-            province_name_en=r.province_name_en,
-            district_name=r.district_name,
-            district_name_en=r.district_name_en,
-            risk_level=r.risk_level,
-            count_of_disasters=r.count_of_disasters,
-        )
-        for r in rows
-    ]
+    rows = (await db.execute(stmt)).all()
+    items = rows_to_dicts(rows)
 
-    return ListGraphOut(
-        items=items,
-    )
\ No newline at end of file
+    return json_response({
+        "items": items,
+    })
\ No newline at end of file
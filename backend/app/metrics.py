@@ -0,0 +1,47 @@
+from __future__ import annotations
+import threading
+from typing import Callable
+
+
+class Timer:
+    """นับจำนวนครั้ง + เวลารวม/สูงสุด (วินาที) แบบ thread-safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            mean = self.total / self.count if self.count else 0.0
+            return {"count": self.count, "mean_ms": round(mean * 1000, 3), "max_ms": round(self.max * 1000, 3)}
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        with self._lock:
+            self.value += n
+
+
+_sections: dict[str, Callable[[], dict]] = {}
+
+
+def register_section(name: str, collect: Callable[[], dict]) -> None:
+    """แต่ละ module ลงทะเบียนฟังก์ชันคืนค่า metrics ของตัวเอง → รวมใน /metrics"""
+    _sections[name] = collect
+
+
+def collect_metrics() -> dict:
+    return {name: collect() for name, collect in _sections.items()}
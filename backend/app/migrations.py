@@ -0,0 +1,148 @@
+from __future__ import annotations
+import logging
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.engine import Connection
+
+from .database import Base
+from .models import RAIN_POINTS_PK_SEQ, RainPoint, own_rain_pk_sequence
+from .partitions import ensure_rain_partitions, is_partitioned
+
+
+logger = logging.getLogger("migrations")
+
+
+def _create_indexes(*names: str) -> Callable[[Connection], None]:
+    """สร้าง index ที่ประกาศไว้ใน models.py (ถ้ายังไม่มี) — create_all ไม่เพิ่ม index ให้ตารางที่มีอยู่แล้ว"""
+    def apply(conn: Connection) -> None:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in names:
+                    index.create(bind=conn, checkfirst=True)
+    return apply
+
+
+def _partition_rain_points(conn: Connection) -> None:
+    """
+    ย้าย rain_points เดิม (heap table เดียว) ไปเป็นตาราง partition ตามปี
+    แถวที่ date เป็น NULL ไม่มี partition รองรับจึงไม่ถูกย้าย
+    """
+    if conn.dialect.name != "postgresql" or is_partitioned(conn, "rain_points"):
+        return
+
+    conn.execute(text("ALTER TABLE rain_points RENAME TO rain_points_unpartitioned"))
+    conn.execute(text("ALTER TABLE rain_points_unpartitioned RENAME CONSTRAINT rain_points_pkey TO rain_points_unpartitioned_pkey"))
+    conn.execute(text("ALTER SEQUENCE IF EXISTS rain_points_pk_id_seq RENAME TO rain_points_unpartitioned_pk_id_seq"))
+    for index in RainPoint.__table__.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    # unique (date, district_id) ยังสร้างไม่ได้ — แถวซ้ำในตารางเดิมถูกลบใน 0003 (_unique_rain_points)
+    RAIN_POINTS_PK_SEQ.create(conn, checkfirst=True)
+    conn.execute(CreateTable(RainPoint.__table__))
+    own_rain_pk_sequence(conn)
+    for index in RainPoint.__table__.indexes:
+        if index.name != "uq_rain_points_date_district":
+            index.create(bind=conn)
+    years = [y for (y,) in conn.execute(text("""
+        SELECT DISTINCT CAST(EXTRACT(YEAR FROM date) AS INTEGER)
+        FROM rain_points_unpartitioned WHERE date IS NOT NULL
+    """))]
+    ensure_rain_partitions(conn, years)
+
+    cols = ", ".join(c.name for c in RainPoint.__table__.columns)
+    conn.execute(text(f"""
+        INSERT INTO rain_points ({cols})
+        SELECT {cols} FROM rain_points_unpartitioned WHERE date IS NOT NULL
+    """))
+    conn.execute(text("""
+        SELECT setval(pg_get_serial_sequence('rain_points', 'pk_id'),
+                      COALESCE((SELECT MAX(pk_id) FROM rain_points), 0) + 1, false)
+    """))
+    conn.execute(text("DROP TABLE rain_points_unpartitioned"))
+
+
+def _unique_rain_points(conn: Connection) -> None:
+    """ลบแถวซ้ำ (date, district_id) จากการอัปโหลดซ้ำในอดีต เก็บแถวล่าสุด แล้วสร้าง unique index"""
+    conn.execute(text("""
+        DELETE FROM rain_points
+        WHERE pk_id NOT IN (SELECT MAX(pk_id) FROM rain_points GROUP BY date, district_id)
+    """))
+    _create_indexes("uq_rain_points_date_district")(conn)
+
+
+def _unique_incident_points(conn: Connection) -> None:
+    """
+    รวมแถวซ้ำ (disaster_date, province_id, district_id) เป็นแถวแรกของกลุ่ม แล้วสร้าง unique index
+    - count_of_disasters ของแถวที่เก็บไว้ = ผลรวมทั้งกลุ่ม (summary ใช้ SUM อยู่แล้ว ตัวเลขจึงไม่เปลี่ยน)
+    - แถวที่ disaster_date เป็น NULL ไม่ถือว่าซ้ำกัน (เหมือน unique index) จึงไม่ถูกแตะ
+    """
+    conn.execute(text("""
+        UPDATE incident_statistics_points
+        SET count_of_disasters = g.total
+        FROM (
+            SELECT MIN(incident_id) AS keep_id, SUM(count_of_disasters) AS total
+            FROM incident_statistics_points
+            WHERE disaster_date IS NOT NULL
+            GROUP BY disaster_date, province_id, district_id
+            HAVING COUNT(*) > 1
+        ) g
+        WHERE incident_statistics_points.incident_id = g.keep_id
+    """))
+    conn.execute(text("""
+        DELETE FROM incident_statistics_points
+        WHERE disaster_date IS NOT NULL
+          AND incident_id NOT IN (
+            SELECT MIN(incident_id) FROM incident_statistics_points
+            WHERE disaster_date IS NOT NULL
+            GROUP BY disaster_date, province_id, district_id
+          )
+    """))
+    _create_indexes("uq_incident_statistics_points_date_district")(conn)
+
+
+def _add_column(table_name: str, column_name: str) -> Callable[[Connection], None]:
+    """เพิ่มคอลัมน์ที่ประกาศไว้ใน models.py ให้ตารางที่มีอยู่แล้ว (create_all ไม่เพิ่มให้)"""
+    def apply(conn: Connection) -> None:
+        if column_name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+            return
+        column = Base.metadata.tables[table_name].c[column_name]
+        conn.execute(text(
+            f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(dialect=conn.dialect)}"
+        ))
+    return apply
+
+
+# (ชื่อ, ฟังก์ชัน) — เพิ่มต่อท้ายเท่านั้น ห้ามแก้ลำดับของที่ apply ไปแล้ว
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ("0001_composite_list_indexes", _create_indexes(
+        "ix_rain_points_district_date",
+        "ix_rain_points_province_date",
+        "ix_incident_statistics_points_district_date",
+        "ix_risk_points_district_upload",
+    )),
+    ("0002_partition_rain_points_by_year", _partition_rain_points),
+    ("0003_unique_rain_points_date_district", _unique_rain_points),
+    ("0004_unique_incident_points_date_district", _unique_incident_points),
+    ("0005_ingest_job_heartbeat", _add_column("ingest_job", "heartbeat_at")),
+]
+
+
+def run_migrations(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        applied = {name for (name,) in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, apply in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        logger.info("applied migration %s", name)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Index, JSON, Text, ForeignKey, BigInteger, Float
+from sqlalchemy import Column, Integer, String, DateTime, Date, Index, JSON, Text, ForeignKey, BigInteger, Float, Sequence, event, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import PrimaryKeyConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, backref
 from .database import Base
@@ -41,11 +43,18 @@ class District(Base):
 	province         = relationship("Province", backref=backref("districts", cascade="all, delete-orphan"), passive_deletes=True)
 	
 	
+RAIN_POINTS_PK_SEQ = Sequence("rain_points_pk_id_seq")
+
+
 class RainPoint(Base):
     __tablename__     = "rain_points"
-    pk_id             = Column(BigInteger, primary_key=True, index=True)
+    # Postgres: แบ่ง partition ตามช่วงปีของ date (rain_points_y2024, ...) ดู partitions.py
+    # partition key ต้องอยู่ใน primary key จึงเป็น (pk_id, date) — SQLAlchemy ไม่ autoincrement PK หลายคอลัมน์
+    # pk_id จึงใช้ sequence ชัดเจน (+ server default ดู own_rain_pk_sequence) ส่วน SQLite ใช้ pk_id เป็น PK เดียว
+    __table_args__    = {"postgresql_partition_by": "RANGE (date)"}
+    pk_id             = Column(BigInteger().with_variant(Integer, "sqlite"), RAIN_POINTS_PK_SEQ, primary_key=True, index=True)
     upload_id         = Column(Integer, ForeignKey("upload_rain_point.upload_id", ondelete="CASCADE"), nullable=False, index=True)
-    date              = Column(Date, nullable=True) # วันที่ (YYYY-MM-DD) จากแกน time
+    date              = Column(Date, primary_key=True) # วันที่ (YYYY-MM-DD) จากแกน time
     year              = Column(Integer, nullable=True)   
     province_id       = Column(Integer, ForeignKey("province.province_id", ondelete="CASCADE"), nullable=False, index=True)    
     district_id       = Column(Integer, ForeignKey("district.district_id", ondelete="CASCADE"), nullable=False, index=True)
@@ -54,6 +63,26 @@ class RainPoint(Base):
     district          = relationship("District", backref=backref("districts", cascade="all, delete-orphan"), passive_deletes=True)
     province          = relationship("Province", backref=backref("province", cascade="all, delete-orphan"), passive_deletes=True)
 	
+def own_rain_pk_sequence(conn) -> None:
+    """Postgres: ให้ nextval เป็น server default ของ pk_id (COPY/INSERT ... SELECT ไม่ส่ง pk_id) และ DROP TABLE ลบ sequence ตาม"""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(f"ALTER SEQUENCE {RAIN_POINTS_PK_SEQ.name} OWNED BY rain_points.pk_id"))
+    conn.execute(text(f"ALTER TABLE rain_points ALTER COLUMN pk_id SET DEFAULT nextval('{RAIN_POINTS_PK_SEQ.name}')"))
+
+
+@event.listens_for(RainPoint.__table__, "after_create")
+def _after_create_rain_points(target, connection, **kw):
+    own_rain_pk_sequence(connection)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint, compiler, **kw):
+    # SQLite ไม่มี partition: PK ของ rain_points เหลือ pk_id (INTEGER) คอลัมน์เดียว → เป็น rowid ได้เลขอัตโนมัติ
+    if constraint.table.name == RainPoint.__tablename__:
+        return "PRIMARY KEY (pk_id)"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
 class UploadRisk(Base):
     __tablename__ = "upload_risk"
     upload_risk_id     = Column(Integer, primary_key=True, index=True)
@@ -67,7 +96,7 @@ class UploadRisk(Base):
 
 class RiskPoint(Base):
     __tablename__     = "risk_points"
-    risk_id           = Column(BigInteger, primary_key=True, index=True)
+    risk_id           = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, index=True)
     upload_risk_id    = Column(Integer, ForeignKey("upload_risk.upload_risk_id", ondelete="CASCADE"), nullable=False, index=True)
     province_id       = Column(Integer, ForeignKey("province.province_id", ondelete="CASCADE"), nullable=False, index=True)    
     district_id       = Column(Integer, ForeignKey("district.district_id", ondelete="CASCADE"), nullable=False, index=True)
@@ -77,7 +106,7 @@ class RiskPoint(Base):
 
 class IncidentStatisticsPoint(Base):
     __tablename__      = "incident_statistics_points"
-    incident_id        = Column(BigInteger, primary_key=True, index=True)
+    incident_id        = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, index=True)
     disaster_date      = Column(Date, nullable=True) # วันที่ (YYYY-MM-DD) จากแกน time
     year               = Column(Integer, nullable=True)   
     province_id        = Column(Integer, ForeignKey("province.province_id", ondelete="CASCADE"), nullable=False, index=True)    
@@ -86,6 +115,36 @@ class IncidentStatisticsPoint(Base):
     district           = relationship("District", backref=backref("incident_statistics_points", cascade="all, delete-orphan"), passive_deletes=True)
     province           = relationship("Province", backref=backref("incident_statistics_points", cascade="all, delete-orphan"), passive_deletes=True)
 
+class DailyDistrictSummary(Base):
+    """สรุปรายวันต่ออำเภอสำหรับ dashboard (/list_data_graph) — อัปเดตโดย summary.refresh_* หลัง ingest"""
+    __tablename__      = "daily_district_summary"
+    date               = Column(Date, primary_key=True)
+    district_id        = Column(Integer, ForeignKey("district.district_id", ondelete="CASCADE"), primary_key=True)
+    province_id        = Column(Integer, ForeignKey("province.province_id", ondelete="CASCADE"), nullable=False)
+    rain_mm_wmean      = Column(Float, nullable=True)
+    risk_level         = Column(Integer, nullable=True)
+    count_of_disasters = Column(Integer, nullable=False, default=0)
+
+class IngestJob(Base):
+    __tablename__ = "ingest_job"
+    job_id         = Column(Integer, primary_key=True, index=True)
+    kind           = Column(String, nullable=False)                     # netcdf | dbf | excel
+    state          = Column(String, nullable=False, default="queued")   # queued | running | done | failed
+    storage_path   = Column(String, nullable=False)
+    params         = Column(JSON, nullable=True)
+    upload_id      = Column(Integer, ForeignKey("upload_rain_point.upload_id", ondelete="CASCADE"), nullable=True, index=True)
+    upload_risk_id = Column(Integer, ForeignKey("upload_risk.upload_risk_id", ondelete="CASCADE"), nullable=True, index=True)
+    owner_id       = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL"), nullable=True)
+    rows_written   = Column(BigInteger, nullable=False, default=0)
+    steps_done     = Column(Integer, nullable=False, default=0)
+    steps_total    = Column(Integer, nullable=True)
+    result         = Column(JSON, nullable=True)
+    error          = Column(Text, nullable=True)
+    time_create    = Column(DateTime(timezone=True), server_default=func.now())
+    time_start     = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at   = Column(DateTime(timezone=True), nullable=True)     # worker ที่รันอยู่ต่ออายุทุก JOB_HEARTBEAT_SEC
+    time_finish    = Column(DateTime(timezone=True), nullable=True)
+
 
 # ดัชนีที่ช่วย query
 Index("ix_rain_points_date", RainPoint.date)
@@ -96,4 +155,19 @@ Index("ix_province_name", Province.province_name)
 Index("ix_province_name_en", Province.province_name_en)
 Index("ix_district_province", District.province_id)
 Index("ix_district_name", District.district_name)
-Index("ix_district_name_en", District.district_name_en)
\ No newline at end of file
+Index("ix_district_name_en", District.district_name_en)
+Index("ix_ingest_job_state", IngestJob.state)
+
+# composite ตาม pattern ของ list endpoint: กรอง district/province + ช่วงวันที่ แล้ว sort ตามวันที่
+Index("ix_rain_points_district_date", RainPoint.district_id, RainPoint.date)
+Index("ix_rain_points_province_date", RainPoint.province_id, RainPoint.date)
+Index("ix_incident_statistics_points_district_date", IncidentStatisticsPoint.district_id, IncidentStatisticsPoint.disaster_date)
+Index("ix_risk_points_district_upload", RiskPoint.district_id, RiskPoint.upload_risk_id)
+
+# หนึ่งแถวต่ออำเภอต่อวัน — ใช้เป็น conflict target ของ upsert ตอน ingest ซ้ำ
+Index("uq_rain_points_date_district", RainPoint.date, RainPoint.district_id, unique=True)
+Index(
+    "uq_incident_statistics_points_date_district",
+    IncidentStatisticsPoint.disaster_date, IncidentStatisticsPoint.province_id, IncidentStatisticsPoint.district_id,
+    unique=True,
+)
\ No newline at end of file
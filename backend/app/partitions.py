@@ -0,0 +1,48 @@
+from __future__ import annotations
+import logging
+from typing import Iterable
+
+from sqlalchemy import text
+
+
+logger = logging.getLogger("partitions")
+
+
+def rain_partition_name(year: int) -> str:
+    return f"rain_points_y{int(year)}"
+
+
+def ensure_rain_partitions(conn, years: Iterable[int]) -> None:
+    """สร้าง partition รายปีของ rain_points ที่ยังไม่มี (Postgres เท่านั้น; engine อื่นไม่มี partition)"""
+    if conn.dialect.name != "postgresql":
+        return
+    for year in sorted({int(y) for y in years}):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {rain_partition_name(year)}
+            PARTITION OF rain_points
+            FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+        """))
+
+
+def detach_rain_partition(conn, year: int, drop: bool = False) -> None:
+    """
+    เอาข้อมูลฝนทั้งปีออกด้วยการ detach partition (แทน DELETE จำนวนมาก)
+    drop=False จะเก็บตารางที่ detach แล้วไว้ (ชื่อ rain_points_yYYYY) เผื่อย้าย/สำรอง
+    """
+    name = rain_partition_name(year)
+    conn.execute(text(f"ALTER TABLE rain_points DETACH PARTITION {name}"))
+    if drop:
+        conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text("""
+        DELETE FROM daily_district_summary
+        WHERE date >= :date_min AND date < :date_next
+    """), {"date_min": f"{year}-01-01", "date_next": f"{year + 1}-01-01"})
+    logger.info("detached rain partition %s (drop=%s)", name, drop)
+
+
+def is_partitioned(conn, table_name: str) -> bool:
+    return conn.execute(text("""
+        SELECT c.relkind = 'p'
+        FROM pg_class c
+        WHERE c.oid = to_regclass(:table_name)
+    """), {"table_name": table_name}).scalar() or False
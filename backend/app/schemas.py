@@ -35,8 +35,9 @@ class RainPointOut(BaseModel):
 class ListPaginationOut(BaseModel):
     page: int
     page_size: int
-    total: int
-    all_page: int
+    total: int | None = None
+    all_page: int | None = None
+    next_cursor: str | None = None
     items: List[RainPointOut]
     
 class ProvinceDistrictPointOut(BaseModel):
@@ -112,8 +113,9 @@ class IncidentStatisticsPointOut(BaseModel):
 class ListIncidentStatisticsPaginationOut(BaseModel):
     page: int
     page_size: int
-    total: int
-    all_page: int
+    total: int | None = None
+    all_page: int | None = None
+    next_cursor: str | None = None
     items: List[IncidentStatisticsPointOut]
 
 class DateLimitOut(BaseModel):
@@ -131,9 +133,28 @@ class GraphPointOut(BaseModel):
     district_name: str
     province_name_en: str
     district_name_en: str
-    risk_level: int
+    risk_level: int | None = None
     count_of_disasters: int
     class Config:
         from_attributes = True
 class ListGraphOut(BaseModel):
-    items: List[GraphPointOut]
\ No newline at end of file
+    items: List[GraphPointOut]
+
+class JobOut(BaseModel):
+    job_id: int
+    kind: str
+    state: str
+    rows_written: int
+    steps_done: int
+    steps_total: int | None = None
+    result: Dict[str, Any] | None = None
+    error: str | None = None
+    time_create: dt.datetime | None = None
+    time_start: dt.datetime | None = None
+    time_finish: dt.datetime | None = None
+    class Config:
+        from_attributes = True
+
+class JobSubmitOut(BaseModel):
+    job_id: int
+    state: str
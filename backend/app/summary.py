@@ -0,0 +1,88 @@
+from __future__ import annotations
+import logging
+from datetime import date
+
+from sqlalchemy import text
+
+
+logger = logging.getLogger("summary")
+
+# risk ล่าสุดต่ออำเภอ = แถวจาก upload_risk_id ล่าสุด
+_LATEST_RISK = """
+    SELECT district_id, risk_level
+    FROM (
+        SELECT district_id, risk_level,
+               ROW_NUMBER() OVER (PARTITION BY district_id ORDER BY upload_risk_id DESC, risk_id DESC) AS rn
+        FROM risk_points
+    ) ranked
+    WHERE rn = 1
+"""
+
+
+def refresh_daily_summary(conn, date_min: date, date_max: date) -> None:
+    """
+    คำนวณแถวของ daily_district_summary ใหม่ในช่วงวันที่ [date_min, date_max]
+    เรียกใน transaction เดียวกับงาน ingest ที่เขียน rain_points / incident_statistics_points
+    """
+    if date_min is None or date_max is None:
+        return
+    params = {"date_min": date_min, "date_max": date_max}
+    conn.execute(text("""
+        DELETE FROM daily_district_summary
+        WHERE date >= :date_min AND date <= :date_max
+    """), params)
+    conn.execute(text(f"""
+        INSERT INTO daily_district_summary
+            (date, district_id, province_id, rain_mm_wmean, risk_level, count_of_disasters)
+        SELECT r.date, r.district_id, r.province_id, r.rain_mm_wmean,
+               lr.risk_level,
+               COALESCE(i.count_of_disasters, 0)
+        FROM (
+            SELECT date, district_id, province_id, rain_mm_wmean,
+                   ROW_NUMBER() OVER (PARTITION BY date, district_id ORDER BY pk_id DESC) AS rn
+            FROM rain_points
+            WHERE date >= :date_min AND date <= :date_max
+        ) r
+        LEFT JOIN ({_LATEST_RISK}) lr ON lr.district_id = r.district_id
+        LEFT JOIN (
+            SELECT disaster_date, district_id, SUM(count_of_disasters) AS count_of_disasters
+            FROM incident_statistics_points
+            WHERE disaster_date >= :date_min AND disaster_date <= :date_max
+            GROUP BY disaster_date, district_id
+        ) i ON i.district_id = r.district_id AND i.disaster_date = r.date
+        WHERE r.rn = 1
+    """), params)
+
+
+def refresh_daily_summary_risk(conn) -> None:
+    """
+    risk ใหม่มีผลกับทุกวัน → อัปเดต risk_level ด้วย join ครั้งเดียว (ไม่ใช่ subquery ต่อแถว)
+    เขียนเฉพาะแถวที่ค่าเปลี่ยน; อำเภอที่ไม่มี risk เหลือแล้วกลับเป็น NULL
+    """
+    conn.execute(text(f"""
+        UPDATE daily_district_summary
+        SET risk_level = lr.risk_level
+        FROM ({_LATEST_RISK}) lr
+        WHERE lr.district_id = daily_district_summary.district_id
+          AND daily_district_summary.risk_level IS DISTINCT FROM lr.risk_level
+    """))
+    conn.execute(text("""
+        UPDATE daily_district_summary
+        SET risk_level = NULL
+        WHERE risk_level IS NOT NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM risk_points rp WHERE rp.district_id = daily_district_summary.district_id
+          )
+    """))
+
+
+def ensure_daily_summary(engine) -> None:
+    """startup: ถ้าตารางสรุปยังว่างแต่มีข้อมูลฝนแล้ว ให้สร้างทั้งหมดครั้งเดียว"""
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM daily_district_summary LIMIT 1")).first() is not None:
+            return
+        date_min, date_max = conn.execute(text("SELECT MIN(date), MAX(date) FROM rain_points")).one()
+        if date_min is None:
+            return
+        refresh_daily_summary(conn, date_min, date_max)
+        logger.info("built daily_district_summary for %s .. %s", date_min, date_max)
@@ -1,18 +1,32 @@
 from __future__ import annotations
-import os, logging, re, io
+import os, logging, re
 import numpy as np
 import xarray as xr
 import pandas as pd
 import unicodedata
+import hashlib
+from functools import partial
+from typing import Callable
 import geopandas as gpd
+import shapely
+from scipy import sparse
 from dbfread import DBF
 
-from .models import Province, District
-from fastapi import File, UploadFile, HTTPException
-from sqlalchemy import text
+from .models import Province, District, RainPoint, UploadRainPoint
+from .bulk import bulk_insert_df, upsert_df, insert_new_df
+from .summary import refresh_daily_summary, refresh_daily_summary_risk
+from .partitions import ensure_rain_partitions
+from .cache import bump_data_version
+from .boundaries import CACHE_DIR, file_signature, load_adm2, load_adm2_north, north_provinces_en, select_provinces
+from fastapi import HTTPException
+from sqlalchemy import text, func, select, insert
 
 
 logger = logging.getLogger("utils")
+RAIN_AGG_MODE = os.getenv("RAIN_AGG_MODE", "matrix")              # matrix | points
+RAIN_CELL_WEIGHTING = os.getenv("RAIN_CELL_WEIGHTING", "center")  # center | area
+NC_TIME_CHUNK = int(os.getenv("NC_TIME_CHUNK", "31"))             # จำนวน time step ต่อ chunk
+NC_INCREMENTAL = os.getenv("NC_INCREMENTAL", "0") == "1"           # 1 = ข้ามวันที่มีใน DB แล้วของไฟล์ชื่อเดียวกัน
 ACCEPTED_SHEETS = [
     "ดินถล่ม67-รายการพื้นที่เกิด",
     "พื้นที่เกิด",
@@ -33,62 +47,147 @@ def clean_text(x):
     return s
 
 
-def ingest_nc_north_adm2_to_db(
-    engine,
-    upload_id: int,
-    nc_path: str,
+def _grid_step(coord: np.ndarray) -> float:
+    return float(np.abs(np.diff(np.sort(np.unique(coord)))).min())
+
+
+def build_cell_district_weights(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    adm2_north: gpd.GeoDataFrame,
+    mode: str = "center",
+) -> dict:
+    """
+    สร้าง mapping กริด → อำเภอ แบบ sparse (COO: cell, district, weight)
+    - mode="center": cell อยู่ในอำเภอถ้าจุดกึ่งกลาง cell อยู่ใน polygon (เหมือน sjoin predicate="within"), weight = 1
+    - mode="area"  : weight = สัดส่วนพื้นที่ cell ที่ทับกับ polygon (คิดในระบบพิกัดองศา ซึ่งพอสำหรับ cell ขนาด 0.05°)
+    cell index = i_lat * len(lon) + i_lon (ตรงกับลำดับ C-order ของ precip[time, lat, lon])
+    """
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    geoms = adm2_north.geometry.values
+
+    if mode == "area":
+        half_lat = _grid_step(lat) / 2
+        half_lon = _grid_step(lon) / 2
+        cells = shapely.box(
+            lon2d.ravel() - half_lon, lat2d.ravel() - half_lat,
+            lon2d.ravel() + half_lon, lat2d.ravel() + half_lat,
+        )
+        dist_idx, cell_idx = shapely.STRtree(cells).query(geoms, predicate="intersects")
+        overlap = shapely.area(shapely.intersection(cells[cell_idx], geoms[dist_idx]))
+        weight = overlap / shapely.area(cells[cell_idx])
+        keep = weight > 0
+        dist_idx, cell_idx, weight = dist_idx[keep], cell_idx[keep], weight[keep]
+    else:
+        points = shapely.points(lon2d.ravel(), lat2d.ravel())
+        dist_idx, cell_idx = shapely.STRtree(points).query(geoms, predicate="contains")
+        weight = np.ones(len(cell_idx), dtype="float64")
+
+    # เก็บเฉพาะ cell ที่ตกในอำเภอใดอำเภอหนึ่ง → row index แบบ compact
+    cells_used, rows = np.unique(cell_idx, return_inverse=True)
+    return {
+        "cells": cells_used.astype("int64"),
+        "rows": rows.astype("int64"),
+        "cols": dist_idx.astype("int64"),
+        "weight": weight.astype("float64"),
+        "province": adm2_north["province"].to_numpy(dtype=str),
+        "district": adm2_north["district"].to_numpy(dtype=str),
+    }
+
+
+_CELL_WEIGHTS_MEMO: dict[str, dict] = {}
+
+
+def load_cell_district_weights(
+    lat: np.ndarray,
+    lon: np.ndarray,
     adm2_shp_path: str,
-) -> int:
+    mode: str | None = None,
+) -> dict:
     """
-    เขียนลงตารางเดิม 'rain_points' แบบ 'หนึ่งแถวต่ออำเภอต่อวัน'
-    - เร็วเท่ากับตอนก่อนแก้ (ไม่เขียนทุก grid)
-    - เติม lat/lon จาก centroid ของ polygon อำเภอ เพื่อผ่าน NOT NULL
+    คืน mapping กริด → อำเภอ จาก cache (memory → ไฟล์ .npz ใต้ STORAGE_DIR/cache)
+    สร้างใหม่เฉพาะเมื่อ grid, shapefile, รายชื่อจังหวัด หรือ mode เปลี่ยน
     """
+    mode = mode or RAIN_CELL_WEIGHTING
+    h = hashlib.sha1()
+    h.update(np.asarray(lat, dtype="float64").tobytes())
+    h.update(np.asarray(lon, dtype="float64").tobytes())
+    h.update(file_signature(adm2_shp_path).encode())
+    h.update(",".join(sorted(north_provinces_en())).encode())
+    h.update(mode.encode())
+    key = h.hexdigest()
+
+    if key in _CELL_WEIGHTS_MEMO:
+        return _CELL_WEIGHTS_MEMO[key]
+
+    cache_path = os.path.join(CACHE_DIR, f"cellmap_{mode}_{key}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as f:
+            weights = {k: f[k] for k in f.files}
+    else:
+        weights = build_cell_district_weights(lat, lon, load_adm2_north(adm2_shp_path), mode=mode)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npz"  # หลาย process อาจสร้างพร้อมกัน
+        np.savez(tmp_path, **weights)
+        os.replace(tmp_path, cache_path)
+        logger.info("built cell→district weights: %d cells, %d pairs -> %s",
+                    len(weights["cells"]), len(weights["rows"]), cache_path)
+
+    _CELL_WEIGHTS_MEMO[key] = weights
+    return weights
+
+
+def aggregate_daily_by_matrix(da: xr.DataArray, weights: dict) -> pd.DataFrame:
+    """
+    สรุปฝนรายอำเภอ/วัน ด้วย sparse matrix multiply ต่อ time step แทน sjoin ทุกจุด
+    คืนคอลัมน์: time, province, district, rain_mm_wmean, rainfall_mm
+    """
+    lat = da["latitude"].to_numpy().astype("float64")
+    lon = da["longitude"].to_numpy().astype("float64")
+    cells = weights["cells"]
+    n_dist = len(weights["district"])
+    W = sparse.csr_matrix(
+        (weights["weight"], (weights["rows"], weights["cols"])),
+        shape=(len(cells), n_dist),
+    )
 
-    # ---------- 1) โหลด province/district mapping จาก DB เป็น DataFrame ----------
-    rows = engine.query(
-        Province.province_id, Province.province_name, Province.province_name_en
-    ).all()
-    provinces_df = pd.DataFrame(rows, columns=["province_id","province_name","province_name_en"])
+    cell_lat = lat[cells // len(lon)]
+    coslat = np.cos(np.deg2rad(cell_lat))
+    km_per_deg = 111.32
+    cell_area_km2 = km_per_deg * _grid_step(lat) * km_per_deg * _grid_step(lon) * coslat
 
-    rows = engine.query(
-        District.district_id, District.province_id, District.district_name, District.district_name_en
-    ).all()
-    districts_df = pd.DataFrame(rows, columns=["district_id","province_id","district_name","district_name_en"])
+    values = da.transpose("time", "latitude", "longitude").to_numpy()
+    values = values.reshape(values.shape[0], -1)[:, cells].astype("float64")
+    positive = np.isfinite(values) & (values > 0)
+    precip = np.where(positive, values, 0.0)
 
-    provinces_df["key_en"] = provinces_df["province_name_en"].map(clean_text)
-    districts_df["key_en"] = districts_df["district_name_en"].map(clean_text)
+    # (time x cell) @ (cell x district) → (time x district)
+    num = (W.T @ (precip * coslat).T).T
+    den = (W.T @ (positive * coslat).T).T
+    vol = (W.T @ (precip * cell_area_km2).T).T * 1000 / 1e6
 
-    # ---------- 2) เปิด NetCDF + ตัด bbox ไทย ----------
-    ds = xr.open_dataset(nc_path)
-    lon = ds["longitude"]
-    if float(lon.max()) > 180:
-        lon2 = ((lon + 180) % 360) - 180
-        ds = ds.assign_coords(longitude=lon2).sortby("longitude")
+    t_idx, d_idx = np.nonzero(den > 0)
+    return pd.DataFrame({
+        "time": da["time"].to_numpy()[t_idx],
+        "province": weights["province"][d_idx],
+        "district": weights["district"][d_idx],
+        "rain_mm_wmean": num[t_idx, d_idx] / den[t_idx, d_idx],
+        "rainfall_mm": vol[t_idx, d_idx],
+    })
 
-    lat_min, lat_max = 5.6, 20.5
-    lon_min, lon_max = 97.3, 105.7
-    ds_th = ds.sel(latitude=slice(lat_min, lat_max), longitude=slice(lon_min, lon_max))
-    da = ds_th["precip"]
 
+def aggregate_daily_by_points(da: xr.DataArray, adm2_north: gpd.GeoDataFrame) -> pd.DataFrame:
+    """
+    วิธีเดิม: sjoin ทุกจุดกริดกับ polygon อำเภอ (เก็บไว้ใช้เทียบผลกับ aggregate_daily_by_matrix)
+    คืนคอลัมน์: time, province, district, rain_mm_wmean, rainfall_mm
+    """
     da_pos = da.where(da.notnull() & (da > 0), drop=True)
 
     # DataFrame point-level (แค่ใช้คำนวณ aggregate)
     df_values = da_pos.to_dataframe(name="precip").reset_index()
 
-    # ---------- 3) โหลด shapefile ADM2 และกรองเฉพาะภาคเหนือ ----------
-    adm2 = gpd.read_file(adm2_shp_path).to_crs("EPSG:4326")
-
-    north_env = os.getenv(
-        "NORTH_PROVS_EN",
-        "Chiang Mai,Chiang Rai,Lamphun,Lampang,Phayao,Phrae,Nan,Mae Hong Son,Uttaradit"
-    )
-    north_list = [x.strip() for x in north_env.split(",")]
-
-    adm2_north = adm2[adm2["ADM1_EN"].isin(north_list)][["ADM1_EN","ADM2_EN","geometry"]].copy()
-    adm2_north = adm2_north.rename(columns={"ADM1_EN":"province","ADM2_EN":"district"})
-
-    # ---------- 4) sjoin จุดกริดกับขอบเขตอำเภอ → เพื่อคำนวณสรุประดับอำเภอ ----------
     gdf_points = gpd.GeoDataFrame(
         df_values,
         geometry=gpd.points_from_xy(df_values["longitude"], df_values["latitude"]),
@@ -97,37 +196,42 @@ def ingest_nc_north_adm2_to_db(
     gdf_joined = gpd.sjoin(gdf_points, adm2_north, how="inner", predicate="within")
     # ตอนนี้มีคอลัมน์: time, latitude, longitude, precip, province, district
 
-    # ---------- 5) คำนวณค่าเฉลี่ยถ่วงน้ำหนัก + ปริมาณรวม (ต่ออำเภอ/วัน) ----------
-    gdf_joined["weight"] = np.cos(np.deg2rad(gdf_joined["latitude"]))
-
-    # weighted mean (หลีกเลี่ยง FutureWarning)
-    daily_wmean = (
-        gdf_joined[gdf_joined["precip"].notna() & (gdf_joined["precip"] > 0)]
-        .groupby(["time","province","district"], observed=True)
-        .apply(lambda df: np.average(df["precip"].to_numpy(),
-                                     weights=df["weight"].to_numpy()))
-        .rename("rain_mm_wmean").reset_index()
-    )
+    gdf_joined = gdf_joined[gdf_joined["precip"].notna() & (gdf_joined["precip"] > 0)]
 
-    # area + volume รวม (ล้าน m³)
-    dlat = float(np.abs(np.diff(sorted(gdf_joined["latitude"].unique()))).min())
-    dlon = float(np.abs(np.diff(sorted(gdf_joined["longitude"].unique()))).min())
+    # area ต่อ cell (km²) สำหรับปริมาณรวม (ล้าน m³) — ขนาด cell จากพิกัดกริด (chunk ที่ฝนน้อยอาจไม่มีจุดติดกัน)
+    dlat = _grid_step(da["latitude"].to_numpy())
+    dlon = _grid_step(da["longitude"].to_numpy())
     km_per_deg = 111.32
-    gdf_joined["cell_area_km2"] = (
-        km_per_deg * dlat * km_per_deg * dlon * np.cos(np.deg2rad(gdf_joined["latitude"]))
-    )
-    gdf_joined["rainfall_mm"] = (
-        gdf_joined["precip"] * gdf_joined["cell_area_km2"] * 1000 / 1e6
-    )
-    daily_sum = (
-        gdf_joined[gdf_joined["rainfall_mm"].notna() & (gdf_joined["rainfall_mm"] > 0)]
-        .groupby(["time","province","district"], observed=True)["rainfall_mm"]
-        .sum().reset_index()
-    )
-
-    daily_result = daily_wmean.merge(daily_sum, on=["time","province","district"], how="left")
+    coslat = np.cos(np.deg2rad(gdf_joined["latitude"].to_numpy()))
+    cell_area_km2 = km_per_deg * dlat * km_per_deg * dlon * coslat
+
+    # weighted mean = Σ(precip·w) / Σw และ volume = Σ(precip·area) ต่อกลุ่ม ด้วย bincount บน group code
+    # (แทน groupby.apply ที่เรียก Python หนึ่งครั้งต่อกลุ่ม)
+    grouped = gdf_joined.groupby(["time","province","district"], observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
+    precip = gdf_joined["precip"].to_numpy(dtype="float64")
+
+    sum_pw = np.bincount(codes, weights=precip * coslat, minlength=n_groups)
+    sum_w = np.bincount(codes, weights=coslat, minlength=n_groups)
+    sum_vol = np.bincount(codes, weights=precip * cell_area_km2 * 1000 / 1e6, minlength=n_groups)
+
+    daily_result = grouped.size().index.to_frame(index=False)
+    daily_result["rain_mm_wmean"] = sum_pw / sum_w
+    daily_result["rainfall_mm"] = sum_vol
+    return daily_result
+
+
+def to_rain_points_frame(
+    daily_result: pd.DataFrame,
+    provinces_df: pd.DataFrame,
+    districts_df: pd.DataFrame,
+    upload_id: int,
+) -> pd.DataFrame:
+    """แปลงผลสรุป (time, province, district, ...) → คอลัมน์ตาม schema 'rain_points'"""
 
-    # ---------- 6) map province/district → id (ใช้ key อังกฤษ) ----------
+    # ---------- map province/district → id (ใช้ key อังกฤษ) ----------
+    daily_result = daily_result.copy()
     daily_result["prov_key"] = daily_result["province"].map(clean_text)
     daily_result["dist_key"] = daily_result["district"].map(clean_text)
 
@@ -140,14 +244,10 @@ def ingest_nc_north_adm2_to_db(
         on=["province_id","dist_key"], how="left"
     )
 
-
-    # ตัดแถวที่ยังไม่มี id/centroid (กัน NOT NULL)
-    before = len(daily_result)
+    # ตัดแถวที่ยังไม่มี id (กัน NOT NULL)
     daily_result = daily_result.dropna(subset=["province_id","district_id"]).copy()
-    after = len(daily_result)
-
 
-    # ---------- 8) จัดรูปคอลัมน์ตรง schema 'rain_points' ----------
+    # ---------- จัดรูปคอลัมน์ตรง schema 'rain_points' ----------
     daily_result["date"] = pd.to_datetime(daily_result["time"]).dt.date
     daily_result["year"] = pd.to_datetime(daily_result["time"]).dt.year
     daily_result["upload_id"] = upload_id
@@ -156,122 +256,313 @@ def ingest_nc_north_adm2_to_db(
         "upload_id", "date", "year",
         "province_id", "district_id",
         "rain_mm_wmean",
-        "rainfall_mm" 
+        "rainfall_mm"
     ]].copy()
 
     df_points["district_id"] = df_points["district_id"].astype(int)
     df_points["province_id"] = df_points["province_id"].astype(int)
     df_points["year"]        = df_points["year"].astype(int)
     df_points["rainfall_mm"] = df_points["rainfall_mm"].fillna(0.0).astype(float)
+    return df_points
 
 
-    # ---------- 9) insert ด้วย Engine/Connection จาก Session (ก้อนเดียว) ----------
-    # print(f"➡️  will insert rows: {len(df_points):,} (dropped {before-after:,} rows with missing id/centroid)")
+def load_area_frames(db) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """province/district จาก DB พร้อม key_en (clean_text ของชื่ออังกฤษ) สำหรับ map ผลสรุป → id"""
+    rows = db.query(
+        Province.province_id, Province.province_name, Province.province_name_en
+    ).all()
+    provinces_df = pd.DataFrame(rows, columns=["province_id","province_name","province_name_en"])
+
+    rows = db.query(
+        District.district_id, District.province_id, District.district_name, District.district_name_en
+    ).all()
+    districts_df = pd.DataFrame(rows, columns=["district_id","province_id","district_name","district_name_en"])
+
+    provinces_df["key_en"] = provinces_df["province_name_en"].map(clean_text)
+    districts_df["key_en"] = districts_df["district_name_en"].map(clean_text)
+    return provinces_df, districts_df
+
+
+def open_precip_th(nc_path: str):
+    """เปิด NetCDF แบบ lazy, แปลง longitude 0..360 → -180..180 แล้วตัด bbox ไทย → (ds, precip)"""
+    ds = xr.open_dataset(nc_path)
+    lon = ds["longitude"]
+    if float(lon.max()) > 180:
+        lon2 = ((lon + 180) % 360) - 180
+        ds = ds.assign_coords(longitude=lon2).sortby("longitude")
+
+    lat_min, lat_max = 5.6, 20.5
+    lon_min, lon_max = 97.3, 105.7
+    ds_th = ds.sel(latitude=slice(lat_min, lat_max), longitude=slice(lon_min, lon_max))
+    return ds, ds_th["precip"]
+
+
+def latest_rain_date(db, filename: str):
+    """วันที่ล่าสุดใน rain_points ของแหล่งข้อมูลเดียวกัน (ทุก upload ที่ใช้ชื่อไฟล์นี้) หรือ None"""
+    return (
+        db.query(func.max(RainPoint.date))
+        .join(UploadRainPoint, UploadRainPoint.upload_id == RainPoint.upload_id)
+        .filter(UploadRainPoint.filename == filename)
+        .scalar()
+    )
+
+
+def select_new_days(da: xr.DataArray, after) -> xr.DataArray:
+    """เหลือเฉพาะ time step ที่ใหม่กว่า after (date); after=None → ทั้งหมด"""
+    if after is None:
+        return da
+    days = pd.DatetimeIndex(da["time"].to_numpy()).normalize()
+    return da.isel(time=np.flatnonzero(days > pd.Timestamp(after)))
+
+
+def make_aggregator(da: xr.DataArray, adm2_shp_path: str) -> Callable[[xr.DataArray], pd.DataFrame]:
+    """ฟังก์ชันสรุป chunk → (time, province, district, rain_mm_wmean, rainfall_mm) ตาม RAIN_AGG_MODE"""
+    if RAIN_AGG_MODE == "points":
+        return partial(aggregate_daily_by_points, adm2_north=load_adm2_north(adm2_shp_path))
+    weights = load_cell_district_weights(
+        da["latitude"].to_numpy(), da["longitude"].to_numpy(), adm2_shp_path
+    )
+    return partial(aggregate_daily_by_matrix, weights=weights)
+
+
+def aggregate_nc_file(
+    nc_path: str,
+    adm2_shp_path: str,
+    time_chunk: int | None = None,
+    after=None,
+) -> pd.DataFrame:
+    """
+    สรุปทั้งไฟล์เป็นรายอำเภอ/วัน โดยไม่แตะ DB (ใช้ใน worker ของ batch_ingest)
+    ผลลัพธ์เล็ก (วัน × อำเภอ) จึงคืนทั้งก้อนให้ process แม่เขียนลง DB
+    - after: สรุปเฉพาะวันที่หลังจากนี้ (ดู latest_rain_date)
+    """
+    time_chunk = max(1, int(time_chunk or NC_TIME_CHUNK))
+    ds, da = open_precip_th(nc_path)
+    try:
+        da = select_new_days(da, after)
+        aggregate = make_aggregator(da, adm2_shp_path)
+        parts = []
+        for start in range(0, da.sizes["time"], time_chunk):
+            chunk = da.isel(time=slice(start, start + time_chunk)).load()
+            parts.append(aggregate(chunk))
+            del chunk
+    finally:
+        ds.close()
+    if not parts:
+        return pd.DataFrame(columns=["time","province","district","rain_mm_wmean","rainfall_mm"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def upsert_rain_points(conn, df_points: pd.DataFrame) -> dict[str, int]:
+    """upsert ตาม (date, district_id) — เขียนเฉพาะแถวที่ค่าฝนเปลี่ยน"""
+    return upsert_df(
+        conn, df_points, "rain_points",
+        key_cols=["date", "district_id"],
+        compare_cols=["rain_mm_wmean", "rainfall_mm"],
+    )
+
+
+def ingest_nc_north_adm2_to_db(
+    engine,
+    upload_id: int,
+    nc_path: str,
+    adm2_shp_path: str,
+    time_chunk: int | None = None,
+    progress: Callable[[int, int, int], None] | None = None,
+    incremental: bool | None = None,
+) -> dict[str, int]:
+    """
+    เขียนลงตารางเดิม 'rain_points' แบบ 'หนึ่งแถวต่ออำเภอต่อวัน'
+    - upsert ตาม (date, district_id): อัปโหลดไฟล์ช่วงเวลาซ้ำจะเขียนเฉพาะแถวที่ค่าเปลี่ยน
+      คืนจำนวน {"rows_inserted", "rows_updated", "rows_unchanged"}
+    - อ่าน precip ทีละ time chunk (NC_TIME_CHUNK วัน) แล้วเขียนลง DB ก่อนอ่าน chunk ถัดไป
+      → หน่วยความจำสูงสุดไม่โตตามความยาวแกน time ของไฟล์
+    - progress(rows_written, time_steps_done, time_steps_total) ถูกเรียกหลังเขียนแต่ละ chunk
+    - กริด → อำเภอ ใช้ mapping ที่ cache ไว้ (RAIN_AGG_MODE=points เพื่อใช้ sjoin แบบเดิม)
+    - incremental (ค่าเริ่มต้น NC_INCREMENTAL ซึ่งปิดอยู่): อ่านเฉพาะวันที่ใหม่กว่าวันล่าสุดที่มีใน DB ของไฟล์ชื่อเดียวกัน
+      เช่น CHIRPS preliminary ที่ดาวน์โหลดซ้ำทุกวันโดยต่อท้ายเพิ่มวันละ 1 วัน
+      ดูแค่ชื่อไฟล์ จึงต้องขอเองเท่านั้น — ไฟล์ที่แก้ค่าย้อนหลังใต้ชื่อเดิมต้องอ่านทุกวันให้ upsert ได้
+    """
+    time_chunk = max(1, int(time_chunk or NC_TIME_CHUNK))
+    incremental = NC_INCREMENTAL if incremental is None else incremental
+
+    # ---------- 1) โหลด province/district mapping จาก DB เป็น DataFrame ----------
+    provinces_df, districts_df = load_area_frames(engine)
+
+    # ---------- 2) เปิด NetCDF (lazy) + ตัด bbox ไทย ----------
+    ds, da = open_precip_th(nc_path)
+    if incremental:
+        upload = engine.get(UploadRainPoint, upload_id)
+        after = latest_rain_date(engine, upload.filename) if upload is not None else None
+        n_all = da.sizes["time"]
+        da = select_new_days(da, after)
+        if after is not None:
+            logger.info("rain ingest upload=%s: incremental after %s, %d/%d time steps",
+                        upload_id, after, da.sizes["time"], n_all)
+
+    # ---------- 3) เตรียม mapping กริด → อำเภอ (ครั้งเดียวต่อไฟล์) ----------
+    aggregate = make_aggregator(da, adm2_shp_path)
+
+    # ---------- 4) อ่านทีละ chunk → สรุปรายอำเภอ/วัน → insert ----------
+    n_time = da.sizes["time"]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    date_min = date_max = None
     bind = engine.get_bind()  # ได้ Engine/Connection จริง
+    try:
+        # partition รายปีสร้างใน transaction สั้นแยกต่างหาก ไม่ถือ lock ตาราง rain_points ตลอดการ ingest
+        with bind.begin() as conn:
+            ensure_rain_partitions(conn, pd.DatetimeIndex(da["time"].to_numpy()).year.unique())
+
+        with bind.begin() as conn:
+            for start in range(0, n_time, time_chunk):
+                chunk = da.isel(time=slice(start, start + time_chunk)).load()
+                df_points = to_rain_points_frame(aggregate(chunk), provinces_df, districts_df, upload_id)
+                del chunk
+
+                written = upsert_rain_points(conn, df_points)
+                for k in counts:
+                    counts[k] += written[k]
+                total = counts["inserted"] + counts["updated"]
+                if not df_points.empty:
+                    chunk_min, chunk_max = df_points["date"].min(), df_points["date"].max()
+                    date_min = chunk_min if date_min is None else min(date_min, chunk_min)
+                    date_max = chunk_max if date_max is None else max(date_max, chunk_max)
+                steps_done = min(start + time_chunk, n_time)
+                logger.info("rain ingest upload=%s: %d/%d time steps, %s",
+                            upload_id, steps_done, n_time, counts)
+                if progress is not None:
+                    progress(total, steps_done, n_time)
+
+            refresh_daily_summary(conn, date_min, date_max)
+    finally:
+        ds.close()
+
+    bump_data_version()
+    return {f"rows_{k}": v for k, v in counts.items()}
+
+
+def init_data (engine, shp_path: str):
+    """
+    เติมตาราง province/district จากขอบเขต ADM2 (จังหวัดตาม NORTH_PROVS_EN, "all" = ทั้งประเทศ)
+    อ่าน key เดิมครั้งเดียว เทียบแบบ set แล้ว insert เฉพาะที่ยังไม่มี ทีละตาราง ใน transaction เดียว
+    """
+    # ใช้แค่ชื่อจังหวัด/อำเภอ (ไม่ต้องแปลง geometry) จาก boundary store ที่ cache ไว้แล้ว
+    df = select_provinces(load_adm2(shp_path))[["ADM1_EN","ADM1_TH","ADM2_EN","ADM2_TH"]]
+    names = pd.DataFrame({
+        "province_name_en": map_unique(df["ADM1_EN"], clean_text).str.strip(),
+        "province_name": map_unique(df["ADM1_TH"], clean_text).str.strip(),
+        "district_name_en": map_unique(df["ADM2_EN"], clean_text).str.strip(),
+        "district_name": map_unique(df["ADM2_TH"], clean_text).str.strip(),
+    })
+
+    bind = engine.get_bind()
     with bind.begin() as conn:
-        df_points.to_sql(
-            "rain_points",
-            con=conn,
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=2000
+        # ---------- province: ชื่อไทยใช้ของแถวแรกที่เจอ ----------
+        existing = dict(conn.execute(select(Province.province_name_en, Province.province_id)).all())
+        new_provs = (
+            names.drop_duplicates("province_name_en")
+            .loc[lambda d: ~d["province_name_en"].isin(existing.keys()), ["province_name", "province_name_en"]]
+        )
+        if not new_provs.empty:
+            rows = conn.execute(
+                insert(Province).returning(Province.province_name_en, Province.province_id),
+                new_provs.to_dict("records"),
+            ).all()
+            existing.update(dict(rows))
+
+        # ---------- district: key = (province_id, ชื่ออังกฤษ) ----------
+        names["province_id"] = names["province_name_en"].map(existing)
+        have = pd.DataFrame(
+            conn.execute(select(District.province_id, District.district_name_en)).all(),
+            columns=["province_id", "district_name_en"],
         )
+        new_dists = (
+            names.drop_duplicates(["province_id", "district_name_en"])
+            .merge(have, on=["province_id", "district_name_en"], how="left", indicator=True)
+            .loc[lambda d: d["_merge"] == "left_only", ["district_name", "district_name_en", "province_id"]]
+        )
+        if not new_dists.empty:
+            conn.execute(insert(District), new_dists.astype({"province_id": int}).to_dict("records"))
 
+    logger.info("init_data: %d provinces, %d districts added", len(new_provs), len(new_dists))
+    bump_data_version()
 
-    return len(df_points)
+RISK_CLASS_TEXT = {
+    "ต่ำ": 1, "ต่ำมาก": 1, "low": 1, "very low": 1,
+    "ปานกลาง": 2, "กลาง": 2, "medium": 2,
+    "สูง": 3, "สูงมาก": 3, "high": 3, "very high": 3
+}
+DBF_ENCODING = os.getenv("DBF_ENCODING", "TIS-620")
+RISK_AREA_CRS = os.getenv("RISK_AREA_CRS", "EPSG:6933")        # equal-area สำหรับคิดพื้นที่ (ตร.ม.)
+RISK_DEFAULT_CRS = os.getenv("RISK_DEFAULT_CRS", "EPSG:32647")  # ชั้นข้อมูลที่ไม่มี .prj (UTM 47N)
 
 
-def init_data (engine, shp_path: str):
-    gdf = gpd.read_file(shp_path, encoding="utf-8")
-    if gdf.geometry.name not in gdf.columns or gdf.geometry.dtype.name != "geometry":
-        if "geometry" in gdf.columns:
-            from shapely import wkt
-            gdf = gpd.GeoDataFrame(
-                gdf.drop(columns=["geometry"]),
-                geometry=gdf["geometry"].apply(lambda s: wkt.loads(s) if pd.notna(s) else None),
-                crs="EPSG:4326"
-            )
+def map_unique(values: pd.Series, fn: Callable) -> pd.Series:
+    """เรียก fn เฉพาะค่าที่ไม่ซ้ำ แล้ว map กลับทั้งคอลัมน์ (ค่าในคอลัมน์ซ้ำกันมาก เช่น ชื่ออำเภอ)"""
+    uniques = values.unique()
+    return values.map(dict(zip(uniques, map(fn, uniques))))
 
-    df = gdf.copy()
-    df["geometry"] = df.geometry.apply(lambda g: g.wkt if g is not None else None)
-    NORTH_PROVS_EN = os.getenv("NORTH_PROVS_EN")
-    NORTH_PROVS_EN_LIST = NORTH_PROVS_EN.split(',')
-    finalDF = {}
-
-    filtered_df = df[df['ADM1_EN'].isin(NORTH_PROVS_EN_LIST)]
-
-    # สร้างไฟล์ GEO JSON NORTH
-    # if not os.path.exists('/data/storage/admin/north_provinces_districts.geojson'):
-    #     gdftofile = gdf[gdf["ADM1_EN"].isin(NORTH_PROVS_EN_LIST)]
-    #     gdftofile["ADM1_EN"] = gdftofile["ADM1_EN"].apply(clean_text)
-    #     gdftofile["ADM1_TH"] = gdftofile["ADM1_TH"].apply(clean_text)
-    #     gdftofile["ADM2_EN"] = gdftofile["ADM2_EN"].apply(clean_text)
-    #     gdftofile["ADM2_TH"] = gdftofile["ADM2_TH"].apply(clean_text)
-    #     gdftofile.to_file("/data/storage/admin/north_provinces_districts.geojson", driver="GeoJSON")
-
-    for _, row in filtered_df.iterrows():
-        prov_en = clean_text(row['ADM1_EN'])
-        prov_th = clean_text(row['ADM1_TH'])
-        dist_en = clean_text(row['ADM2_EN'])
-        dist_th = clean_text(row['ADM2_TH'])
-
-        if prov_en not in finalDF:
-            finalDF[prov_en] = {
-                "th": prov_th,
-                "districts": []
-            }
-
-        finalDF[prov_en]["districts"].append({
-            "en": dist_en,
-            "th": dist_th
-        })
-
-    for row in finalDF:
-        is_engine = False
-        pid = 0
-        dataP = engine.query(Province).filter(Province.province_name_en == row.strip()).first()
-        if dataP is None:
-            p = Province(province_name=finalDF[row]['th'].strip(), province_name_en=row.strip())
-            engine.add(p)
-            engine.flush() 
-            pid = p.province_id
-            is_engine = True
-        else: 
-            pid = dataP.province_id
-            
-        for rowD in finalDF[row]['districts']:
-            if engine.query(District).filter(District.district_name_en == rowD['en'].strip(), District.province_id == pid).first() is None:
-                engine.add(District(
-                    district_name=rowD['th'].strip(),
-                    district_name_en=rowD['en'].strip(),
-                    province_id=pid
-                ))
-                is_engine = True
-
-        if is_engine:
-            engine.commit()
-
-def class_to_num(x):
-    text_to_num = {
-        "ต่ำ": 1, "ต่ำมาก": 1, "low": 1, "very low": 1,
-        "ปานกลาง": 2, "กลาง": 2, "medium": 2,
-        "สูง": 3, "สูงมาก": 3, "high": 3, "very high": 3
-    }
-    # ถ้าเป็นเลขอยู่แล้ว
+
+def class_to_num(values: pd.Series) -> pd.Series:
+    """
+    ระดับชั้นความเสี่ยง → 1..3 (ทั้งคอลัมน์)
+    - ตัวเลข 0..1 → แบ่ง 3 ช่วงเท่ากัน, ตัวเลขอื่น → ปัดเศษแล้วบีบให้อยู่ใน 1..3
+    - ข้อความ (ต่ำ/ปานกลาง/สูง, low/medium/high) → lookup ตาม RISK_CLASS_TEXT, ไม่รู้จัก → NaN
+    """
+    as_text = values.astype("string").str.strip()
+    num = pd.to_numeric(as_text, errors="coerce").astype("float64")
+    num = num.where(np.isfinite(num))
+
+    out = pd.Series(np.nan, index=values.index, dtype="float64")
+    frac = num.between(0, 1)
+    out[frac] = np.where(num[frac] < 1/3, 1, np.where(num[frac] < 2/3, 2, 3))
+    whole = num.notna() & ~frac
+    out[whole] = num[whole].round().clip(1, 3)
+
+    is_text = num.isna()
+    out[is_text] = as_text[is_text].str.lower().map(RISK_CLASS_TEXT).astype("float64")
+    return out
+
+
+def _match_fields(path: str, columns: list[str], encoding: str) -> list[str]:
+    """ชื่อ field จริงในไฟล์ (ตัวเล็ก/ใหญ่ตามไฟล์) ของ columns ที่ขอ — ตัวที่ไม่มีจะถูกข้าม"""
+    import pyogrio
+    fields = pyogrio.read_info(path, encoding=encoding)["fields"]
+    by_lower = {str(f).lower(): f for f in fields}
+    return [by_lower[c] for c in columns if c in by_lower]
+
+
+def risk_level_from_avg(risk_avg) -> np.ndarray:
+    """ค่าเฉลี่ยระดับชั้น ≤ 1.5 → 1, ≤ 2.1 → 2, มากกว่านั้น → 3"""
+    risk_avg = np.asarray(risk_avg, dtype="float64")
+    return np.where(risk_avg <= 1.5, 1, np.where(risk_avg <= 2.1, 2, 3))
+
+
+def read_dbf_columns(path: str, columns: list[str], encoding: str = DBF_ENCODING) -> pd.DataFrame:
+    """
+    อ่านเฉพาะคอลัมน์ที่ต้องใช้จาก DBF แบบ columnar (pyogrio + Arrow) ชื่อคอลัมน์คืนเป็นตัวเล็ก
+    คอลัมน์ที่ไม่มีในไฟล์จะไม่อยู่ในผลลัพธ์ (ให้ผู้เรียกตรวจเอง)
+    อ่านด้วย pyogrio ไม่ได้ (ไม่มี GDAL/ไฟล์แปลก) → ถอยไปใช้ dbfread แบบเดิม
+    """
     try:
-        val = float(x)
-        if 0 <= val <= 1:
-            if val < 1/3: return 1
-            elif val < 2/3: return 2
-            else: return 3
-        val = int(round(val))
-        return max(1, min(3, val))
-    except Exception:
-        pass
-    # ถ้าเป็นข้อความ
-    s = str(x).strip().lower()
-    return text_to_num.get(s, None)
+        import pyogrio
+        wanted = _match_fields(path, columns, encoding)
+        df = pyogrio.read_dataframe(
+            path, columns=wanted, read_geometry=False, encoding=encoding, use_arrow=True
+        )
+        df = df.rename(columns={c: c.lower() for c in df.columns})
+        # ข้อความว่างใน DBF → pyogrio คืน NaN แต่ dbfread คืน "" → ทำให้เหมือนกัน
+        text_cols = df.select_dtypes(include=["object", "string"]).columns
+        df[text_cols] = df[text_cols].fillna("")
+        return df
+    except Exception as e:
+        logger.warning("pyogrio cannot read %s (%s); falling back to dbfread", path, e)
+
+    table = DBF(path, load=False, encoding=encoding, lowernames=True)
+    wanted = [c for c in columns if c in table.field_names]
+    return pd.DataFrame.from_records(
+        ([rec[c] for c in wanted] for rec in table), columns=wanted
+    )
 
 def normalize_th(s: str) -> str:
     """ตัดช่องว่างหัว-ท้าย ยุบช่องว่างซ้ำ เป็นคีย์จับคู่แบบเรียบง่าย"""
@@ -283,22 +574,19 @@ def normalize_th(s: str) -> str:
 
     return s
 
-def ingest_dbf_to_db(
+def mean_risk_points(
     engine,
     upload_risk_id: int,
     raw_path: str,
     special_fix: bool=False
-) -> int:
-    # ---------- 0) โหลด DBF ----------
-    table = DBF(raw_path, load=True, encoding="tis-620")
-    df_dbf = pd.DataFrame(iter(table))
-
-    # ตรวจคอลัมน์ (รองรับ case-insensitive)
-    df_dbf = df_dbf.rename(columns={col: col.lower() for col in df_dbf.columns})
+) -> pd.DataFrame:
+    """ระดับความเสี่ยงรายอำเภอ = ค่าเฉลี่ย class ของทุก record ใน DBF (จับคู่ด้วยชื่อไทย amphoe_t/prov_nam_t)"""
+    # ---------- 0) โหลด DBF (เฉพาะ 3 คอลัมน์ที่ใช้, ชื่อคอลัมน์ case-insensitive) ----------
+    df_dbf = read_dbf_columns(raw_path, ["amphoe_t", "prov_nam_t", "class"])
     required_cols = {"amphoe_t", "prov_nam_t", "class"}
     missing = required_cols - set(df_dbf.columns)
     if missing:
-        print("⚠️ columns ใน DBF:", list(df_dbf.columns))
+        logger.warning("DBF %s is missing %s; columns: %s", raw_path, sorted(missing), list(df_dbf.columns))
         raise KeyError("ไม่พบคอลัมน์สำคัญใน DBF (คาดว่า amphoe_t, prov_nam_t, class)")
 
     # ---------- 1) เตรียมข้อมูลจาก DB ----------
@@ -315,8 +603,8 @@ def ingest_dbf_to_db(
     # คีย์ normalize
     provinces_df = provinces_df.copy()
     districts_df = districts_df.copy()
-    provinces_df["prov_key"] = provinces_df["province_name"].astype(str).map(normalize_th)
-    districts_df["dist_key"] = districts_df["district_name"].astype(str).map(normalize_th)
+    provinces_df["prov_key"] = map_unique(provinces_df["province_name"].astype(str), normalize_th)
+    districts_df["dist_key"] = map_unique(districts_df["district_name"].astype(str), normalize_th)
 
     if special_fix:
         # fix ให้ทุกแถวเป็นจังหวัด "อุตรดิตถ์" ไปเลย
@@ -329,7 +617,7 @@ def ingest_dbf_to_db(
 
         if bad_mask.any():
             df_dbf.loc[bad_mask, "prov_nam_t"] = target_key
-            print(f"⚠️ special_fix: set province → Uttaradit ({utt.province_name})")
+            logger.warning("special_fix: set province of %d rows -> Uttaradit (%s)", int(bad_mask.sum()), utt.province_name)
 
     # district + province metadata
     dist_with_prov = districts_df.merge(
@@ -340,14 +628,14 @@ def ingest_dbf_to_db(
     ).rename(columns={"prov_key":"prov_key_db"})
 
     # ---------- 2) เตรียมข้อมูลจากไฟล์ ----------
-    df_dbf["amphoe_t"]   = df_dbf["amphoe_t"].astype(str).map(normalize_th)
-    df_dbf["prov_nam_t"] = df_dbf["prov_nam_t"].astype(str).map(normalize_th)
+    df_dbf["amphoe_t"]   = map_unique(df_dbf["amphoe_t"].astype(str), normalize_th)
+    df_dbf["prov_nam_t"] = map_unique(df_dbf["prov_nam_t"].astype(str), normalize_th)
 
     # map ระดับชั้นเป็นตัวเลข
-    df_dbf["class_num"] = df_dbf["class"].apply(class_to_num)
+    df_dbf["class_num"] = class_to_num(df_dbf["class"])
     unknown = df_dbf[df_dbf["class_num"].isna()]["class"].drop_duplicates()
     if len(unknown) > 0:
-        print("⚠️ พบ class ที่ยัง map ไม่ได้:", unknown.to_list())
+        logger.warning("unmapped risk classes in %s: %s", raw_path, unknown.to_list())
 
     # สรุปเฉลี่ยความเสี่ยงต่อ (จังหวัด, อำเภอ)
     risk_by_amp = (
@@ -357,13 +645,7 @@ def ingest_dbf_to_db(
              .rename(columns={"class_num":"risk_avg"})
     )
 
-    def avg_to_level(x: float) -> int:
-        if x <= 1.5: return 1
-        elif x <= 2.1: return 2
-        elif x > 2.1: return 3
-        else: return 3
-
-    risk_by_amp["risk_level"] = risk_by_amp["risk_avg"].apply(avg_to_level)
+    risk_by_amp["risk_level"] = risk_level_from_avg(risk_by_amp["risk_avg"])
     risk_by_amp["prov_key"] = risk_by_amp["prov_nam_t"]
     risk_by_amp["dist_key"] = risk_by_amp["amphoe_t"]
 
@@ -418,19 +700,127 @@ def ingest_dbf_to_db(
     result = pd.concat([result_matched, fill_df], ignore_index=True).drop_duplicates(
         subset=["district_id","upload_risk_id"], keep="first"
     )
+    return result
+
+
+def read_risk_polygons(shp_path: str) -> gpd.GeoDataFrame:
+    """
+    อ่าน .shp ของชั้นความเสี่ยง (ต้องมี .shx/.dbf ชื่อเดียวกัน) เฉพาะคอลัมน์ class + geometry
+    → class_num, geometry ใน RISK_AREA_CRS (แก้ polygon ที่ไม่ valid ให้แล้ว)
+    """
+    fields = _match_fields(shp_path, ["class"], DBF_ENCODING)
+    if not fields:
+        raise KeyError("ไม่พบคอลัมน์ class ในชั้นข้อมูลความเสี่ยง")
+    gdf = gpd.read_file(shp_path, columns=fields, encoding=DBF_ENCODING, engine="pyogrio", use_arrow=True)
+    if gdf.crs is None:
+        logger.warning("%s has no .prj; assuming %s", shp_path, RISK_DEFAULT_CRS)
+        gdf = gdf.set_crs(RISK_DEFAULT_CRS)
+
+    gdf["class_num"] = class_to_num(gdf[fields[0]])
+    gdf = gdf[gdf["class_num"].notna() & ~(gdf.geometry.isna() | gdf.geometry.is_empty)]
+    gdf = gdf[["class_num", "geometry"]].to_crs(RISK_AREA_CRS).reset_index(drop=True)
+
+    invalid = ~gdf.geometry.is_valid
+    if invalid.any():
+        gdf.loc[invalid, "geometry"] = gdf.geometry[invalid].make_valid()
+    return gdf
+
+
+def area_weighted_risk(shp_path: str, adm2_shp_path: str) -> pd.DataFrame:
+    """
+    ค่าเฉลี่ย class ถ่วงด้วยพื้นที่ที่ซ้อนทับกับแต่ละอำเภอ (ADM2) → province, district, risk_avg, area_km2
+    - จับคู่ polygon ↔ อำเภอด้วย STRtree (bbox) แล้วคิดทั้งก้อนแบบ array ของ shapely 2
+    - polygon ที่อยู่ในอำเภอเดียวทั้งก้อน (contains_properly กับ ADM2 ที่ prepare แล้ว) ใช้พื้นที่ตัวเองเลย
+      คำนวณ intersection เฉพาะ polygon ที่คร่อมเส้นเขต ซึ่งเป็นส่วนน้อยแต่แพงที่สุด
+    """
+    risk = read_risk_polygons(shp_path)
+    adm2 = load_adm2_north(adm2_shp_path).to_crs(RISK_AREA_CRS)
+    risk_geoms = risk.geometry.to_numpy()
+    adm_geoms = adm2.geometry.to_numpy()
+
+    tree = shapely.STRtree(adm_geoms)
+    risk_idx, adm_idx = tree.query(risk_geoms)
+
+    shapely.prepare(adm_geoms)
+    area = shapely.area(risk_geoms[risk_idx])
+    crossing = ~shapely.contains_properly(adm_geoms[adm_idx], risk_geoms[risk_idx])
+    area[crossing] = shapely.area(
+        shapely.intersection(risk_geoms[risk_idx[crossing]], adm_geoms[adm_idx[crossing]])
+    )
 
-    # ---------- 6) เขียนลง DB ----------
+    classes = risk["class_num"].to_numpy()[risk_idx]
+    covered = np.bincount(adm_idx, weights=area, minlength=len(adm2))
+    weighted = np.bincount(adm_idx, weights=area * classes, minlength=len(adm2))
+    has_risk = covered > 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        risk_avg = weighted / covered
+    return pd.DataFrame({
+        "province": adm2["province"].to_numpy()[has_risk],
+        "district": adm2["district"].to_numpy()[has_risk],
+        "risk_avg": risk_avg[has_risk],
+        "area_km2": covered[has_risk] / 1e6,
+    })
+
+
+def area_risk_points(engine, upload_risk_id: int, shp_path: str, adm2_shp_path: str) -> pd.DataFrame:
+    """ระดับความเสี่ยงรายอำเภอจาก area_weighted_risk; อำเภอที่ไม่มี polygon ในจังหวัดเดียวกัน → risk_level=1"""
+    risk_by_area = area_weighted_risk(shp_path, adm2_shp_path)
+    provinces_df, districts_df = load_area_frames(engine)
+
+    risk_by_area["prov_key"] = risk_by_area["province"].map(clean_text)
+    risk_by_area["dist_key"] = risk_by_area["district"].map(clean_text)
+    matched = risk_by_area.merge(
+        provinces_df[["province_id","key_en"]].rename(columns={"key_en":"prov_key"}),
+        on="prov_key", how="inner"
+    ).merge(
+        districts_df[["district_id","province_id","key_en"]].rename(columns={"key_en":"dist_key"}),
+        on=["province_id","dist_key"], how="inner"
+    )
+    matched["risk_level"] = risk_level_from_avg(matched["risk_avg"])
+
+    fill_df = districts_df[
+        districts_df["province_id"].isin(matched["province_id"].unique())
+        & ~districts_df["district_id"].isin(matched["district_id"])
+    ][["province_id","district_id"]].copy()
+    fill_df["risk_level"] = 1
+
+    result = pd.concat(
+        [matched[["province_id","district_id","risk_level"]], fill_df], ignore_index=True
+    ).astype({"province_id":"int64","district_id":"int64","risk_level":"int64"})
+    result["upload_risk_id"] = int(upload_risk_id)
+    return result
+
+
+def ingest_dbf_to_db(
+    engine,
+    upload_risk_id: int,
+    raw_path: str,
+    special_fix: bool=False,
+    aggregation: str="mean",
+    shp_path: str | None=None,
+    adm2_shp_path: str | None=None,
+) -> int:
+    """
+    aggregation:
+    - "mean": เฉลี่ย class ต่อ record ตามชื่อจังหวัด/อำเภอใน DBF (แบบเดิม)
+    - "area": ถ่วงด้วยพื้นที่จาก geometry ใน shp_path ซ้อนกับขอบเขต ADM2 (adm2_shp_path)
+      ไม่ใช้ชื่อไทยใน DBF และ special_fix
+    """
+    if aggregation == "area":
+        if not shp_path or not adm2_shp_path:
+            raise ValueError("aggregation='area' ต้องมี shp_path และ adm2_shp_path")
+        result = area_risk_points(engine, upload_risk_id, shp_path, adm2_shp_path)
+    else:
+        result = mean_risk_points(engine, upload_risk_id, raw_path, special_fix)
+
+    # ---------- เขียนลง DB ----------
     bind = engine.get_bind()
     with bind.begin() as conn:
-        result.to_sql(
-            "risk_points",
-            con=conn,
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=2000
-        )
+        bulk_insert_df(conn, result, "risk_points")
+        refresh_daily_summary_risk(conn)
 
+    bump_data_version()
     return int(len(result))
 
 
@@ -467,41 +857,83 @@ def choose_sheet(available: list[str], requested: str | None) -> str:
     return available[0]
 
 
-async def ingest_excel_to_db(
-    engine,
-    file: UploadFile = File(...)
-) -> int:
-    
-    content = await file.read()
-    try:
-        xls = pd.ExcelFile(io.BytesIO(content), engine="openpyxl")
-        all_sheets = xls.sheet_names
-
-        formatExcel = 1
-        target = choose_sheet(all_sheets, None)
-
-        df = pd.read_excel(io.BytesIO(content), sheet_name=target, engine="openpyxl")
-        df.columns = [str(c).strip() for c in df.columns]
+EXCEL_BATCH_ROWS = int(os.getenv("EXCEL_BATCH_ROWS", "5000"))
+INCIDENT_ON_CONFLICT = os.getenv("INCIDENT_ON_CONFLICT", "skip")   # skip | sum
+EXCEL_HEADER_SCAN_ROWS = 10
+EXCEL_REQUIRED_COLS = ["Disaster Date", "Province", "District"]
+# รูปแบบที่ 2: หัวตารางภาษาไทยอยู่แถวที่ 3 (สองแถวแรกเป็นชื่อรายงาน)
+EXCEL_HEADER_TH = {"วันที่เกิดภัย": "Disaster Date", "จังหวัด": "Province", "อำเภอ": "District"}
 
 
-        required_cols = ["Disaster Date", "Province", "District"]
-        for col in required_cols:
-            if col not in df.columns:
-                formatExcel = 2
+def _excel_header_index(row) -> dict[str, int] | None:
+    """แถวนี้เป็นหัวตารางไหม → {ชื่อคอลัมน์มาตรฐาน: ตำแหน่ง} ถ้ามีครบทั้ง 3 คอลัมน์"""
+    pos = {}
+    for i, cell in enumerate(row):
+        if cell is None:
+            continue
+        name = str(cell).strip()
+        name = EXCEL_HEADER_TH.get(name, name)
+        if name in EXCEL_REQUIRED_COLS and name not in pos:
+            pos[name] = i
+    return pos if len(pos) == len(EXCEL_REQUIRED_COLS) else None
 
-        if formatExcel == 2:
-            df = pd.read_excel(
-            io.BytesIO(content),
-                sheet_name=target,
-                skiprows=2,   # ⬅️ ข้ามสองแถวแรก
-                engine="openpyxl"
-            )
-            df.columns = [str(c).strip() for c in df.columns]
 
-            df = df.rename(columns={'วันที่เกิดภัย' : 'Disaster Date', 'จังหวัด' : 'Province', 'อำเภอ' : 'District'})
-        else:
-            df = df[required_cols]
+def iter_excel_batches(xlsx_path: str, sheet: str | None = None, batch_rows: int | None = None):
+    """
+    อ่าน Excel แบบ streaming (openpyxl read_only) รอบเดียว → DataFrame ทีละ batch
+    คอลัมน์ Disaster Date, Province, District (ค่าดิบจาก cell)
+    หัวตารางหาจาก EXCEL_HEADER_SCAN_ROWS แถวแรก (รองรับทั้งหัวอังกฤษแถวแรก และหัวไทยแถวที่ 3)
+    """
+    from openpyxl import load_workbook
 
+    batch_rows = batch_rows or EXCEL_BATCH_ROWS
+    wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        ws = wb[choose_sheet(wb.sheetnames, sheet)]
+        rows = ws.iter_rows(values_only=True)
+
+        header = None
+        for _, row in zip(range(EXCEL_HEADER_SCAN_ROWS), rows):
+            header = _excel_header_index(row)
+            if header is not None:
+                break
+        if header is None:
+            raise KeyError(f"ไม่พบหัวตาราง {EXCEL_REQUIRED_COLS} ใน {EXCEL_HEADER_SCAN_ROWS} แถวแรก")
+
+        cols = [header[c] for c in EXCEL_REQUIRED_COLS]
+        width = max(cols) + 1
+        batch = []
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            values = [row[i] for i in cols]
+            if all(v is None for v in values):
+                continue
+            batch.append(values)
+            if len(batch) >= batch_rows:
+                yield pd.DataFrame(batch, columns=EXCEL_REQUIRED_COLS)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=EXCEL_REQUIRED_COLS)
+    finally:
+        wb.close()
+
+
+def ingest_excel_to_db(
+    engine,
+    xlsx_path: str,
+    on_conflict: str | None = None,
+) -> dict[str, int]:
+    """
+    on_conflict: key (วัน, จังหวัด, อำเภอ) ที่มีใน DB แล้ว
+    - "skip" (ค่าเริ่มต้น INCIDENT_ON_CONFLICT): ข้าม
+    - "sum": บวก count_of_disasters ของไฟล์เข้ากับแถวเดิม
+    คืนจำนวน {"rows_inserted", "rows_updated", "rows_skipped"}
+    (rows_skipped รวมแถวในไฟล์ที่อ่าน Disaster Date ไม่ได้ — แถวพวกนี้ไม่ถูกเขียนลง DB)
+    """
+    on_conflict = on_conflict or INCIDENT_ON_CONFLICT
+    
+    try:
         provinces = engine.query(Province).all()
         districts = engine.query(District).all()
 
@@ -509,108 +941,59 @@ async def ingest_excel_to_db(
         province_map = {p.province_name.strip(): p.province_id for p in provinces}
         district_map = {d.district_name.strip(): d.district_id for d in districts}
 
-        def map_province(name):
-            return province_map.get(str(name).strip())
-
-        def map_district(name):
-            return district_map.get(str(name).strip())
-
-        df["province_id"] = df["Province"].map(map_province)
-        df["district_id"] = df["District"].map(map_district)
-        df["Disaster Date"] = pd.to_datetime(
-            df["Disaster Date"],
-            format="%Y-%m-%d",  # ถ้าข้อมูล Excel เป็น yyyy-mm-dd
-            errors="coerce"
-        )
-
-        df["year"] = df["Disaster Date"].dt.year
-
-        df["Disaster Date"] = df["Disaster Date"].dt.date
-
-        # ✅ แยกเป็น 2 กลุ่ม
-        df = df.rename(columns={'Disaster Date' : 'disaster_date'})
-
-        matched = df.dropna(subset=["province_id", "district_id"])
-
-        
-
-        # ✅ เตรียมผลลัพธ์
-        # unmatched = df[df["province_id"].isna() | df["district_id"].isna()]
-        # matched_preview = matched[["disaster_date", "year", "province_id", "district_id"]].fillna("").to_dict(orient="records")
-        # unmatched_preview = unmatched[["disaster_date", "year", "Province", "District"]].fillna("").to_dict(orient="records")
-
-        # print(matched_preview)
-        # print(unmatched_preview)
-
-        matched_out = matched.loc[:, ["disaster_date", "year", "province_id", "district_id"]].copy()
-        matched_out["disaster_date"] = pd.to_datetime(matched_out["disaster_date"]).dt.normalize()
-        matched_out["year"] = pd.to_numeric(matched_out["year"], errors="coerce").astype("Int64")
-        matched_out["province_id"] = pd.to_numeric(matched_out["province_id"], errors="coerce").astype("Int64")
-        matched_out["district_id"] = pd.to_numeric(matched_out["district_id"], errors="coerce").astype("Int64")
-        per_key_counts = (
-            matched_out
-            .groupby(["disaster_date", "province_id", "district_id"], as_index=False)
-            .size()
-            .rename(columns={"size": "count_of_disasters"})
-        )
-
-        before_infile = len(matched_out)
-        dedup_infile = matched_out.drop_duplicates(subset=["disaster_date", "province_id", "district_id"], keep="first")
-        after_infile = len(dedup_infile)
-        dropped_infile = before_infile - after_infile
-
-        min_date = dedup_infile["disaster_date"].min()
-        max_date = dedup_infile["disaster_date"].max()
-
-        bind = engine.get_bind()
-        with bind.connect() as conn:
-            existing_keys = pd.read_sql(
-                text("""
-                    SELECT disaster_date, province_id, district_id
-                    FROM incident_statistics_points
-                    WHERE disaster_date >= :min_date AND disaster_date <= :max_date
-                """),
-                conn,
-                params={"min_date": min_date, "max_date": max_date}
+        # นับจำนวนเหตุต่อ (วัน, จังหวัด, อำเภอ) ทีละ batch → เก็บแค่ผลนับ ไม่เก็บทุกแถวของไฟล์
+        key_cols = ["disaster_date", "province_id", "district_id"]
+        counts = []
+        bad_dates = 0
+        for df in iter_excel_batches(xlsx_path):
+            df["province_id"] = df["Province"].astype(str).str.strip().map(province_map)
+            df["district_id"] = df["District"].astype(str).str.strip().map(district_map)
+            df["disaster_date"] = pd.to_datetime(
+                df["Disaster Date"],
+                format="%Y-%m-%d",  # ถ้าข้อมูล Excel เป็น yyyy-mm-dd
+                errors="coerce"
+            ).dt.normalize()
+
+            matched = df.dropna(subset=["province_id", "district_id"])
+            # วันที่อ่านไม่ได้ (NaT) ไม่มี key ให้ ON CONFLICT จับ → ถ้าเขียนลงไปจะได้แถวซ้ำทุกครั้งที่อัปโหลดไฟล์เดิม
+            dated = matched.dropna(subset=["disaster_date"])
+            bad_dates += len(matched) - len(dated)
+            counts.append(
+                dated.groupby(key_cols, as_index=False)
+                .size()
+                .rename(columns={"size": "count_of_disasters"})
             )
 
-        # ---------- left-anti join เหลือเฉพาะแถวที่ยังไม่มีใน DB ----------
-        if not existing_keys.empty:
-            existing_keys["disaster_date"] = pd.to_datetime(existing_keys["disaster_date"]).dt.normalize()
-            existing_keys["province_id"] = pd.to_numeric(existing_keys["province_id"], errors="coerce").astype("Int64")
-            existing_keys["district_id"] = pd.to_numeric(existing_keys["district_id"], errors="coerce").astype("Int64")
-
-            merged = dedup_infile.merge(
-                existing_keys,
-                on=["disaster_date", "province_id", "district_id"],
-                how="left",
-                indicator=True
+        if bad_dates:
+            logger.warning("%s: skipped %d rows with unparseable Disaster Date", xlsx_path, bad_dates)
+        if not counts:
+            return {"rows_inserted": 0, "rows_updated": 0, "rows_skipped": bad_dates}
+        dedup_infile = pd.concat(counts, ignore_index=True).groupby(key_cols, as_index=False)["count_of_disasters"].sum()
+        dedup_infile["year"] = dedup_infile["disaster_date"].dt.year.astype("Int64")
+        dedup_infile["disaster_date"] = dedup_infile["disaster_date"].dt.date
+        dedup_infile["province_id"] = dedup_infile["province_id"].astype("Int64")
+        dedup_infile["district_id"] = dedup_infile["district_id"].astype("Int64")
+        dedup_infile["count_of_disasters"] = dedup_infile["count_of_disasters"].astype(int)
+        dedup_infile = dedup_infile[["disaster_date", "year", "province_id", "district_id", "count_of_disasters"]]
+
+        # -------- staging + ON CONFLICT ฝั่ง DB: ได้กลับมาเฉพาะแถวที่ถูกเขียนจริง --------
+        bind = engine.get_bind()
+        with bind.begin() as conn:
+            written, written_counts = insert_new_df(
+                conn, dedup_infile, "incident_statistics_points",
+                key_cols=key_cols,
+                returning=["disaster_date"],
+                sum_cols=["count_of_disasters"] if on_conflict == "sum" else None,
             )
-            to_insert = merged[merged["_merge"] == "left_only"].drop(columns=["_merge"])
-        else:
-            to_insert = dedup_infile.copy()
-
-        
+            dates = pd.to_datetime(written["disaster_date"])
+            if not dates.empty:
+                refresh_daily_summary(conn, dates.min().date(), dates.max().date())
 
-        to_insert = to_insert.merge(per_key_counts, on=["disaster_date", "province_id", "district_id"], how="left")
-        to_insert["count_of_disasters"] = to_insert["count_of_disasters"].fillna(1).astype(int)
-
-        # -------- เขียนเฉพาะแถวที่เหลือจริง ๆ --------
-        inserted_rows = 0
-        if not to_insert.empty:
-            with bind.begin() as conn:
-                to_insert.to_sql(
-                    "incident_statistics_points",
-                    con=conn,
-                    if_exists="append",
-                    index=False,
-                    method="multi",
-                    chunksize=2000
-                    # ถ้าต้องการกำหนด dtype ชัด ๆ ค่อยเพิ่ม dtype={}
-                )
-            inserted_rows = len(to_insert)
+        if len(written):
+            bump_data_version()
         
-        return inserted_rows
+        written_counts["skipped"] += bad_dates
+        return {f"rows_{k}": v for k, v in written_counts.items()}
      
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"อ่านไฟล์ไม่สำเร็จ: {e}")
@@ -0,0 +1,65 @@
+"""
+เทียบความเร็วเขียน rain_points: DataFrame.to_sql(method="multi") เดิม vs bulk_insert_df (COPY)
+
+    cd backend && DATABASE_URL=postgresql+psycopg://... python -m scripts.bench_bulk_load --rows 200000
+
+เขียนลง temp table ที่มีโครงสร้างเหมือน rain_points จึงไม่กระทบข้อมูลจริง
+
+ผลที่วัดได้ (--rows 200000, PostgreSQL 16 ผ่าน unix socket บนเครื่องเดียวกัน, 1 vCPU, 2 รอบ):
+
+    to_sql(method=multi)      200,000 rows     36.65s         5,457 rows/s
+    bulk_insert_df (COPY)     200,000 rows      1.42s       140,392 rows/s
+    to_sql(method=multi)      200,000 rows     34.82s         5,744 rows/s
+    bulk_insert_df (COPY)     200,000 rows      1.64s       122,255 rows/s
+
+→ COPY เร็วกว่าราว 21-26 เท่า (ผ่านเครือข่ายจริงช่องว่างจะกว้างขึ้น เพราะ to_sql มี round trip ต่อ chunk)
+"""
+from __future__ import annotations
+import argparse, time
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app.database import engine
+from app.bulk import bulk_insert_df
+
+
+def make_frame(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2000-01-01", periods=max(n // 100, 1), freq="D")
+    return pd.DataFrame({
+        "upload_id": 1,
+        "date": np.resize(dates.date, n),
+        "year": np.resize(dates.year, n),
+        "province_id": rng.integers(1, 10, n),
+        "district_id": rng.integers(1, 110, n),
+        "rain_mm_wmean": rng.gamma(0.5, 5, n),
+        "rainfall_mm": rng.gamma(0.5, 50, n),
+    })
+
+
+def run(label: str, df: pd.DataFrame, write) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_rain_points"))
+        conn.execute(text("CREATE TEMP TABLE bench_rain_points (LIKE rain_points INCLUDING DEFAULTS)"))
+        t0 = time.perf_counter()
+        write(conn)
+        elapsed = time.perf_counter() - t0
+        conn.execute(text("DROP TABLE bench_rain_points"))
+    print(f"{label:<22} {len(df):>10,} rows  {elapsed:8.2f}s  {len(df) / elapsed:12,.0f} rows/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    run("to_sql(method=multi)", df, lambda conn: df.to_sql(
+        "bench_rain_points", con=conn, if_exists="append", index=False, method="multi", chunksize=2000
+    ))
+    run("bulk_insert_df (COPY)", df, lambda conn: bulk_insert_df(conn, df, "bench_rain_points"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+วัด latency ของ read API ภายใต้ request พร้อมกันหลายตัว (p50/p95/p99, req/s)
+
+    cd backend && python -m scripts.bench_concurrency --base http://localhost:8000 --concurrency 32 --requests 2000
+
+- ยิง request แบบวนตาม ENDPOINTS ด้วย thread pool (urllib ไม่ต้องติดตั้งอะไรเพิ่ม)
+- เทียบก่อน/หลัง: รันกับ server ที่ checkout คนละ commit (uvicorn --workers 1) แล้วเทียบผลที่พิมพ์ออกมา
+- --slow เพิ่ม request ที่ช้า (list_rain ทั้งช่วง + count=exact) ปนเข้าไป: ตอน handler บล็อก event loop
+  request เล็ก ๆ อย่าง /list_province จะ p99 สูงตาม request ที่ช้า
+"""
+from __future__ import annotations
+import argparse, time, statistics, urllib.request, urllib.error
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+ENDPOINTS = [
+    "/list_province",
+    "/list_district?province_id=all",
+    "/get_date_limit",
+    "/list_rain?page=1&page_size=50&order_by=date&order_type=desc",
+    "/list_risk?page=1&page_size=50",
+    "/list_incident_statistics?page=1&page_size=50&order_by=disaster_date",
+]
+SLOW_ENDPOINT = "/list_rain?page=200&page_size=200&order_by=rain_mm_wmean&order_type=desc&count=exact"
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    k = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def fetch(base: str, path: str, timeout: float) -> tuple[str, float, int]:
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(base + path, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return path, (time.perf_counter() - t0) * 1000, status
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--slow", type=int, default=0, help="ทุก ๆ N request แทรก SLOW_ENDPOINT (0 = ไม่แทรก)")
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    paths = []
+    for i in range(args.requests):
+        if args.slow and i % args.slow == 0:
+            paths.append(SLOW_ENDPOINT)
+        else:
+            paths.append(ENDPOINTS[i % len(ENDPOINTS)])
+
+    fetch(args.base, ENDPOINTS[0], args.timeout)  # warm-up
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda p: fetch(args.base, p, args.timeout), paths))
+    elapsed = time.perf_counter() - t0
+
+    by_path = defaultdict(list)
+    errors = 0
+    for path, ms, status in results:
+        by_path[path.split("?")[0] + (" (slow)" if path == SLOW_ENDPOINT else "")].append(ms)
+        errors += status != 200
+
+    all_ms = [ms for _, ms, _ in results]
+    print(f"{args.label} concurrency={args.concurrency} requests={len(results)} errors={errors} "
+          f"{len(results) / elapsed:.1f} req/s")
+    print(f"{'endpoint':<34}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}  (ms)")
+    for name in sorted(by_path):
+        v = by_path[name]
+        print(f"{name:<34}{len(v):>6}{percentile(v, 50):>10.1f}{percentile(v, 95):>10.1f}"
+              f"{percentile(v, 99):>10.1f}{statistics.fmean(v):>10.1f}")
+    print(f"{'all':<34}{len(all_ms):>6}{percentile(all_ms, 50):>10.1f}{percentile(all_ms, 95):>10.1f}"
+          f"{percentile(all_ms, 99):>10.1f}{statistics.fmean(all_ms):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+เทียบ query plan ของ list endpoint ก่อน/หลังมี composite index (ix_rain_points_district_date ฯลฯ)
+
+    cd backend && DATABASE_URL=postgresql+psycopg://.../bench python -m scripts.bench_list_queries --seed-years 10
+
+- ใช้กับฐานข้อมูลสำหรับทดสอบเท่านั้น: ชื่อฐานข้อมูลต้องมีคำว่า "bench" (หรือส่ง --i-know เพื่อยืนยัน)
+  --seed-years จะเติม rain_points / incident_statistics_points /
+  risk_points สังเคราะห์ให้ทุกอำเภอที่มีในตาราง district (รัน /init_data_province_district ก่อน)
+- สำหรับแต่ละ query: DROP composite index → EXPLAIN ANALYZE → CREATE index → ANALYZE → EXPLAIN ANALYZE
+"""
+from __future__ import annotations
+import argparse, json
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.database import engine, Base
+from app import models
+from app.bulk import bulk_insert_df
+from app.partitions import ensure_rain_partitions
+
+
+COMPOSITE_INDEXES = [
+    "ix_rain_points_district_date",
+    "ix_rain_points_province_date",
+    "ix_incident_statistics_points_district_date",
+    "ix_risk_points_district_upload",
+]
+
+QUERIES = {
+    "list_rain by district + date range": """
+        SELECT r.pk_id, r.date, r.rain_mm_wmean FROM rain_points r
+        WHERE r.district_id = :district_id AND r.date >= :date_start AND r.date <= :date_end
+        ORDER BY r.date ASC, r.pk_id ASC LIMIT 50
+    """,
+    "list_rain by province + date range": """
+        SELECT r.pk_id, r.date, r.rain_mm_wmean FROM rain_points r
+        WHERE r.province_id = :province_id AND r.date >= :date_start AND r.date <= :date_end
+        ORDER BY r.date ASC, r.pk_id ASC LIMIT 50
+    """,
+    "list_incident_statistics by district + date range": """
+        SELECT i.incident_id, i.disaster_date FROM incident_statistics_points i
+        WHERE i.district_id = :district_id AND i.disaster_date >= :date_start AND i.disaster_date <= :date_end
+        ORDER BY i.disaster_date ASC LIMIT 50
+    """,
+    "latest risk per district": """
+        SELECT risk_level FROM risk_points
+        WHERE district_id = :district_id ORDER BY upload_risk_id DESC LIMIT 1
+    """,
+}
+
+
+def seed(years: int) -> None:
+    with engine.begin() as conn:
+        districts = pd.read_sql(text("SELECT district_id, province_id FROM district"), conn)
+        if districts.empty:
+            raise SystemExit("ไม่มีข้อมูล district — เรียก /init_data_province_district ก่อน")
+        owner_id = conn.execute(text("SELECT MIN(user_id) FROM users")).scalar_one()
+        if owner_id is None:
+            raise SystemExit("ต้องมี user อย่างน้อย 1 คน (POST /auth/register)")
+
+        upload_id = conn.execute(text("""
+            INSERT INTO upload_rain_point (filename, storage_path, owner_id)
+            VALUES ('bench', 'bench', :owner_id) RETURNING upload_id
+        """), {"owner_id": owner_id}).scalar_one()
+        upload_risk_id = conn.execute(text("""
+            INSERT INTO upload_risk (filename, storage_path, owner_id)
+            VALUES ('bench', 'bench', :owner_id) RETURNING upload_risk_id
+        """), {"owner_id": owner_id}).scalar_one()
+
+        rng = np.random.default_rng(0)
+        dates = pd.date_range(f"{2024 - years + 1}-01-01", "2024-12-31", freq="D")
+        ensure_rain_partitions(conn, dates.year.unique())
+        for year in sorted(set(dates.year)):
+            days = dates[dates.year == year]
+            grid = districts.merge(pd.DataFrame({"date": days.date}), how="cross")
+            grid["upload_id"] = upload_id
+            grid["year"] = year
+            grid["rain_mm_wmean"] = rng.gamma(0.5, 5, len(grid))
+            grid["rainfall_mm"] = rng.gamma(0.5, 50, len(grid))
+            bulk_insert_df(conn, grid, "rain_points")
+
+            incidents = grid.sample(frac=0.01, random_state=year)[["date", "year", "province_id", "district_id"]]
+            incidents = incidents.rename(columns={"date": "disaster_date"})
+            incidents["count_of_disasters"] = 1
+            bulk_insert_df(conn, incidents, "incident_statistics_points")
+
+        risk = districts.copy()
+        risk["upload_risk_id"] = upload_risk_id
+        risk["risk_level"] = rng.integers(1, 4, len(risk))
+        bulk_insert_df(conn, risk, "risk_points")
+    print(f"seeded {len(dates):,} days x {len(districts)} districts")
+
+
+def explain(conn, sql: str, params: dict) -> tuple[str, float]:
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]["Plan"]
+    node = top
+    while node.get("Plans") and node["Node Type"] in ("Limit", "Sort"):
+        node = node["Plans"][0]
+    scan = node["Node Type"] + (f" using {node['Index Name']}" if "Index Name" in node else "")
+    return scan, plan[0]["Execution Time"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed-years", type=int, default=0)
+    parser.add_argument("--i-know", action="store_true",
+                        help="ยืนยันให้รันกับฐานข้อมูลที่ชื่อไม่มีคำว่า bench (จะเติมข้อมูลและ DROP/CREATE index)")
+    args = parser.parse_args()
+
+    db_name = make_url(engine.url).database or ""
+    if "bench" not in db_name.lower() and not args.i_know:
+        raise SystemExit(f"ฐานข้อมูล '{db_name}' ไม่ใช่ฐานข้อมูล bench — สคริปต์นี้เติมข้อมูลสังเคราะห์และ "
+                         "DROP/CREATE composite index; ใช้ฐานข้อมูลที่ชื่อมี 'bench' หรือส่ง --i-know")
+
+    Base.metadata.create_all(bind=engine)
+    if args.seed_years:
+        seed(args.seed_years)
+
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT district_id, province_id FROM district ORDER BY district_id LIMIT 1")).one()
+    params = {
+        "district_id": row.district_id,
+        "province_id": row.province_id,
+        "date_start": "2022-01-01",
+        "date_end": "2022-12-31",
+    }
+
+    indexes = {
+        idx.name: idx
+        for table in Base.metadata.sorted_tables
+        for idx in table.indexes
+        if idx.name in COMPOSITE_INDEXES
+    }
+
+    with engine.begin() as conn:
+        for name in COMPOSITE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ANALYZE"))
+        before = {label: explain(conn, sql, params) for label, sql in QUERIES.items()}
+
+    with engine.begin() as conn:
+        for idx in indexes.values():
+            idx.create(bind=conn, checkfirst=True)
+        conn.execute(text("ANALYZE"))
+        after = {label: explain(conn, sql, params) for label, sql in QUERIES.items()}
+
+    for label in QUERIES:
+        (plan_b, ms_b), (plan_a, ms_a) = before[label], after[label]
+        print(label)
+        print(f"  before: {ms_b:9.2f} ms  {plan_b}")
+        print(f"  after : {ms_a:9.2f} ms  {plan_a}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+เทียบเวลา serialize ผล list endpoint: Pydantic ต่อแถว (แบบเดิม) กับ fast path (dict + orjson)
+
+    cd backend && python -m scripts.bench_serialization --rows 1000 10000
+
+- ใช้ Row จริงของ SQLAlchemy (ตารางชั่วคราวใน SQLite in-memory) คอลัมน์เหมือน list_data_graph
+- แบบเดิม: สร้าง GraphPointOut ทีละแถว → ListGraphOut → FastAPI serialize ตาม response_model
+  (validate อีกรอบ + jsonable_encoder + json.dumps)
+- fast path: rows_to_dicts + orjson.dumps
+"""
+from __future__ import annotations
+import argparse, datetime as dt, json, time
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Date, create_engine, text
+
+from app.schemas import GraphPointOut, ListGraphOut
+from app.fastjson import rows_to_dicts
+
+
+def make_rows(n: int):
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE g (date DATE, rain_mm_wmean FLOAT, province_id INT, district_id INT, "
+                          "province_name TEXT, province_name_en TEXT, district_name TEXT, district_name_en TEXT, "
+                          "risk_level INT, count_of_disasters INT)"))
+        conn.execute(text("INSERT INTO g VALUES (:d, :r, :p, :i, 'เชียงใหม่', 'Chiang Mai', 'เมือง', 'Mueang', :k, :c)"), [
+            {"d": dt.date(2024, 1, 1), "r": i * 0.37, "p": 1 + i % 9, "i": i, "k": 1 + i % 3, "c": i % 2}
+            for i in range(n)
+        ])
+        # SQLite เก็บ date เป็น str → ให้ type Date แปลงกลับเป็น datetime.date เหมือน Postgres
+        return conn.execute(text("SELECT * FROM g").columns(date=Date)).all()
+
+
+def pydantic_path(rows) -> bytes:
+    items = [
+        GraphPointOut(
+            date=r.date,
+            rain_mm_wmean=r.rain_mm_wmean,
+            province_id=r.province_id,
+            district_id=r.district_id,
+            province_name=r.province_name,
+            province_name_en=r.province_name_en,
+            district_name=r.district_name,
+            district_name_en=r.district_name_en,
+            risk_level=r.risk_level,
+            count_of_disasters=r.count_of_disasters,
+        )
+        for r in rows
+    ]
+    model = ListGraphOut(items=items)
+    validated = ListGraphOut.model_validate(model.model_dump())
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(rows) -> bytes:
+    return orjson.dumps({"items": rows_to_dicts(rows)})
+
+
+def bench(fn, rows, repeat: int) -> float:
+    fn(rows)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for n in args.rows:
+        rows = make_rows(n)
+        assert json.loads(pydantic_path(rows)) == json.loads(fast_path(rows))
+        slow = bench(pydantic_path, rows, args.repeat)
+        fast = bench(fast_path, rows, args.repeat)
+        print(f"{n:>7} rows  pydantic {slow:9.2f} ms  orjson {fast:8.2f} ms  x{slow / max(fast, 1e-9):.1f}")
+
+
+if __name__ == "__main__":
+    main()
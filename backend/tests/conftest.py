@@ -0,0 +1,5 @@
+import os, tempfile
+
+# app.database สร้าง engine ตอน import และ boundaries/cache ใช้ STORAGE_DIR → ตั้งค่าก่อน import app
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp(prefix="landslide-test-"))
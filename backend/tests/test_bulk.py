@@ -0,0 +1,90 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app.bulk import bulk_insert_df, insert_new_df, upsert_df
+from app.database import Base, engine
+from app.models import IncidentStatisticsPoint, RainPoint
+
+
+@pytest.fixture
+def rain_table():
+    RainPoint.__table__.create(engine, checkfirst=True)
+    yield
+    RainPoint.__table__.drop(engine)
+
+
+@pytest.fixture
+def incident_table():
+    IncidentStatisticsPoint.__table__.create(engine, checkfirst=True)
+    yield
+    IncidentStatisticsPoint.__table__.drop(engine)
+
+
+def _rain_frame(day: int, values: list[float]) -> pd.DataFrame:
+    date = dt.date(2024, 1, day)
+    return pd.DataFrame({
+        "upload_id": 1,
+        "date": date,
+        "year": date.year,
+        "province_id": 1,
+        "district_id": range(1, len(values) + 1),
+        "rain_mm_wmean": values,
+        "rainfall_mm": values,
+    })
+
+
+def _pk_ids() -> list:
+    with engine.connect() as conn:
+        return list(conn.execute(select(RainPoint.pk_id).order_by(RainPoint.pk_id)).scalars())
+
+
+def test_bulk_insert_assigns_rain_pk_ids(rain_table):
+    with engine.begin() as conn:
+        assert bulk_insert_df(conn, _rain_frame(1, [1.0, 2.0, 3.0]), "rain_points") == 3
+
+    assert _pk_ids() == [1, 2, 3]
+
+
+def test_upsert_assigns_rain_pk_ids_and_keeps_existing(rain_table):
+    keys = dict(key_cols=["date", "district_id"], compare_cols=["rain_mm_wmean", "rainfall_mm"])
+    with engine.begin() as conn:
+        assert upsert_df(conn, _rain_frame(1, [1.0, 2.0]), "rain_points", **keys) == {"inserted": 2, "updated": 0, "unchanged": 0}
+    with engine.begin() as conn:
+        counts = upsert_df(conn, _rain_frame(1, [1.0, 5.0, 7.0]), "rain_points", **keys)
+
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 1}
+    pk_ids = _pk_ids()
+    assert None not in pk_ids and len(set(pk_ids)) == 3
+
+
+def _incident_frame(counts: dict[int, int]) -> pd.DataFrame:
+    return pd.DataFrame({
+        "disaster_date": dt.date(2024, 8, 1),
+        "year": 2024,
+        "province_id": 1,
+        "district_id": list(counts),
+        "count_of_disasters": list(counts.values()),
+    })
+
+
+@pytest.mark.parametrize("sum_cols, expected_counts, expected_totals", [
+    (None, {"inserted": 1, "updated": 0, "skipped": 2}, {1: 1, 2: 1, 3: 4}),
+    (["count_of_disasters"], {"inserted": 1, "updated": 2, "skipped": 0}, {1: 3, 2: 3, 3: 4}),
+])
+def test_insert_new_df_reports_inserted_and_updated(incident_table, sum_cols, expected_counts, expected_totals):
+    keys = dict(key_cols=["disaster_date", "province_id", "district_id"], returning=["district_id"])
+    with engine.begin() as conn:
+        insert_new_df(conn, _incident_frame({1: 1, 2: 1}), "incident_statistics_points", **keys)
+    with engine.begin() as conn:
+        written, counts = insert_new_df(
+            conn, _incident_frame({1: 2, 2: 2, 3: 4}), "incident_statistics_points", **keys, sum_cols=sum_cols
+        )
+
+    assert counts == expected_counts
+    assert len(written) == counts["inserted"] + counts["updated"]
+    with engine.connect() as conn:
+        rows = conn.execute(select(IncidentStatisticsPoint.district_id, IncidentStatisticsPoint.count_of_disasters))
+        assert dict(rows.all()) == expected_totals
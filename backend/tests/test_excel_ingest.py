@@ -0,0 +1,44 @@
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import func, select
+
+from app.database import Base, SessionLocal, engine
+from app.models import District, IncidentStatisticsPoint, Province
+from app.utils import ingest_excel_to_db
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.add(Province(province_id=1, province_name="เชียงใหม่", province_name_en="Chiang Mai"))
+    session.add(District(district_id=1, district_name="แม่ริม", district_name_en="Mae Rim", province_id=1))
+    session.commit()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def xlsx_path(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Disaster Date", "Province", "District"])
+    ws.append(["2024-08-01", "เชียงใหม่", "แม่ริม"])
+    ws.append(["2024-08-01", "เชียงใหม่", "แม่ริม"])
+    ws.append(["ไม่ทราบวันที่", "เชียงใหม่", "แม่ริม"])
+    ws.append([None, "เชียงใหม่", "แม่ริม"])
+    path = tmp_path / "incidents.xlsx"
+    wb.save(path)
+    return str(path)
+
+
+def test_reupload_skips_rows_without_a_date(db, xlsx_path):
+    first = ingest_excel_to_db(db, xlsx_path, on_conflict="skip")
+    second = ingest_excel_to_db(db, xlsx_path, on_conflict="skip")
+
+    assert first == {"rows_inserted": 1, "rows_updated": 0, "rows_skipped": 2}
+    assert second == {"rows_inserted": 0, "rows_updated": 0, "rows_skipped": 3}
+    with engine.connect() as conn:
+        rows = conn.execute(select(func.count(), func.sum(IncidentStatisticsPoint.count_of_disasters))).one()
+    assert tuple(rows) == (1, 2)
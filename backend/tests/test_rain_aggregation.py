@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+import shapely
+import pytest
+
+from app.utils import (
+    aggregate_daily_by_points, aggregate_daily_by_matrix, build_cell_district_weights,
+    clean_text, open_precip_th, to_rain_points_frame,
+)
+
+
+KEYS = ["time", "province", "district"]
+
+
+@pytest.fixture
+def nc_path(tmp_path) -> str:
+    """NetCDF สังเคราะห์แบบ CHIRPS (precip[time, latitude, longitude]) — ขอบบนเลย bbox ไทย (20.5) เพื่อให้ถูกตัด"""
+    rng = np.random.default_rng(0)
+    lat = np.arange(17.025, 21.0, 0.05, dtype="float32")
+    lon = np.arange(98.025, 100.0, 0.05, dtype="float32")
+    values = rng.gamma(0.5, 5, (6, len(lat), len(lon))).astype("float32")
+    values[rng.random(values.shape) < 0.4] = 0
+    values[rng.random(values.shape) < 0.05] = np.nan
+    ds = xr.Dataset(
+        {"precip": (("time", "latitude", "longitude"), values)},
+        coords={"time": pd.date_range("2024-06-01", periods=6), "latitude": lat, "longitude": lon},
+    )
+    path = str(tmp_path / "chirps-test.days_p05.nc")
+    ds.to_netcdf(path)
+    return path
+
+
+@pytest.fixture
+def precip(nc_path):
+    ds, da = open_precip_th(nc_path)
+    yield da.load()
+    ds.close()
+
+
+@pytest.fixture
+def area_frames() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """province/district ในรูปเดียวกับ load_area_frames (ชื่ออำเภอใน DB สะกด 'Mueang')"""
+    provinces_df = pd.DataFrame({"province_id": [50, 51], "province_name_en": ["Chiang Mai", "Lamphun"]})
+    districts_df = pd.DataFrame({
+        "district_id": [5001, 5002, 5101],
+        "province_id": [50, 50, 51],
+        "district_name_en": ["Mueang", "Hang Dong", "Mueang"],
+    })
+    provinces_df["key_en"] = provinces_df["province_name_en"].map(clean_text)
+    districts_df["key_en"] = districts_df["district_name_en"].map(clean_text)
+    return provinces_df, districts_df
+
+
+@pytest.fixture
+def adm2_north() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {"province": ["Chiang Mai", "Chiang Mai", "Lamphun"], "district": ["Muang", "Hang Dong", "Mueang"]},
+        geometry=[
+            shapely.Polygon([(98.11, 17.51), (98.99, 17.61), (98.91, 18.49), (98.13, 18.41)]),
+            shapely.box(98.99, 17.61, 99.71, 18.31),
+            shapely.box(98.21, 18.51, 99.49, 18.93),
+        ],
+        crs="EPSG:4326",
+    )
+
+
+def reference_aggregate(da: xr.DataArray, adm2_north: gpd.GeoDataFrame) -> pd.DataFrame:
+    """วิธีก่อน vectorize: sjoin แล้ว groupby.apply(np.average) / groupby.sum ทีละกลุ่ม"""
+    da_pos = da.where(da.notnull() & (da > 0), drop=True)
+    df_values = da_pos.to_dataframe(name="precip").reset_index()
+    points = gpd.GeoDataFrame(
+        df_values, geometry=gpd.points_from_xy(df_values["longitude"], df_values["latitude"]), crs="EPSG:4326"
+    )
+    joined = gpd.sjoin(points, adm2_north, how="inner", predicate="within")
+    joined = joined[joined["precip"].notna() & (joined["precip"] > 0)].copy()
+    joined["weight"] = np.cos(np.deg2rad(joined["latitude"]))
+
+    wmean = (
+        joined.groupby(KEYS, observed=True)
+        .apply(lambda df: np.average(df["precip"].to_numpy(), weights=df["weight"].to_numpy()))
+        .rename("rain_mm_wmean").reset_index()
+    )
+    dlat = float(np.diff(np.unique(da["latitude"])).min())
+    dlon = float(np.diff(np.unique(da["longitude"])).min())
+    joined["rainfall_mm"] = joined["precip"] * 111.32 * dlat * 111.32 * dlon * joined["weight"] * 1000 / 1e6
+    volume = joined.groupby(KEYS, observed=True)["rainfall_mm"].sum().reset_index()
+    return wmean.merge(volume, on=KEYS, how="left")
+
+
+RAIN_COLUMNS = ["upload_id", "date", "year", "province_id", "district_id", "rain_mm_wmean", "rainfall_mm"]
+
+
+def _rain_points(daily: pd.DataFrame, area_frames) -> pd.DataFrame:
+    df = to_rain_points_frame(daily, *area_frames, upload_id=7)
+    # วิธีเดิมได้ wmean เป็น float32 ตาม precip → เทียบค่าเป็น float64
+    df = df.astype({"rain_mm_wmean": "float64", "rainfall_mm": "float64"})
+    return df.sort_values(["date", "district_id"]).reset_index(drop=True)
+
+
+def test_open_precip_th_crops_to_thailand(precip):
+    assert float(precip["latitude"].max()) <= 20.5
+    assert precip.sizes["time"] == 6
+
+
+def test_points_path_matches_groupby_apply(precip, adm2_north, area_frames):
+    expected = _rain_points(reference_aggregate(precip, adm2_north), area_frames)
+    result = _rain_points(aggregate_daily_by_points(precip, adm2_north), area_frames)
+
+    # 6 วัน × 3 อำเภอ ครบทุกแถว ('Muang' ใน shapefile map เข้า 'Mueang' ใน DB)
+    assert len(expected) == 6 * 3
+    assert list(result.columns) == RAIN_COLUMNS
+    assert set(result["district_id"]) == {5001, 5002, 5101}
+    assert set(result["upload_id"]) == {7} and set(result["year"]) == {2024}
+    # วิธีเดิมบวกสะสมเป็น float32 → เทียบด้วย tolerance ของ float32
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-5)
+
+
+def test_matrix_path_matches_groupby_apply(precip, adm2_north, area_frames):
+    weights = build_cell_district_weights(
+        precip["latitude"].to_numpy(), precip["longitude"].to_numpy(), adm2_north, mode="center"
+    )
+    expected = _rain_points(reference_aggregate(precip, adm2_north), area_frames)
+    result = _rain_points(aggregate_daily_by_matrix(precip, weights), area_frames)
+
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-5)
@@ -0,0 +1,76 @@
+import geopandas as gpd
+import shapely
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.database import Base, engine
+from app.models import Province, District
+from app.utils import area_weighted_risk, area_risk_points
+
+
+@pytest.fixture
+def adm2_path(tmp_path) -> str:
+    """เชียงใหม่ 3 อำเภอ (A | B ติดกันที่ลองจิจูด 99, C ไม่มี polygon ความเสี่ยง) + ลำพูน 1 อำเภอ"""
+    gdf = gpd.GeoDataFrame(
+        {
+            "ADM1_EN": ["Chiang Mai", "Chiang Mai", "Chiang Mai", "Lamphun"],
+            "ADM2_EN": ["District A", "District B", "District C", "District D"],
+        },
+        geometry=[
+            shapely.box(98.0, 18.0, 99.0, 19.0),
+            shapely.box(99.0, 18.0, 100.0, 19.0),
+            shapely.box(98.0, 19.0, 100.0, 20.0),
+            shapely.box(98.0, 17.0, 100.0, 18.0),
+        ],
+        crs="EPSG:4326",
+    )
+    path = str(tmp_path / "adm2.shp")
+    gdf.to_file(path)
+    return path
+
+
+@pytest.fixture
+def risk_path(tmp_path) -> str:
+    # class 3 คร่อมเส้นเขต A|B ครึ่งต่อครึ่ง (กว้าง 0.5° แต่ละฝั่ง), class 1 อยู่ใน A ทั้งก้อน (กว้าง 0.4°)
+    gdf = gpd.GeoDataFrame(
+        {"CLASS": ["3", "ต่ำ"]},
+        geometry=[shapely.box(98.5, 18.2, 99.5, 18.4), shapely.box(98.1, 18.2, 98.5, 18.4)],
+        crs="EPSG:4326",
+    )
+    path = str(tmp_path / "risk.shp")
+    gdf.to_file(path, encoding="TIS-620")
+    return path
+
+
+def test_area_weighted_risk_splits_boundary_polygon(adm2_path, risk_path):
+    result = area_weighted_risk(risk_path, adm2_path).set_index("district")
+
+    assert sorted(result.index) == ["District A", "District B"]
+    # พื้นที่ใน equal-area CRS ∝ ความกว้างลองจิจูดเมื่อช่วงละติจูดเท่ากัน
+    assert result.loc["District A", "risk_avg"] == pytest.approx((0.5 * 3 + 0.4 * 1) / 0.9)
+    assert result.loc["District B", "risk_avg"] == pytest.approx(3.0)
+    assert result.loc["District A", "area_km2"] / result.loc["District B", "area_km2"] == pytest.approx(0.9 / 0.5)
+
+
+def test_area_risk_points_fills_uncovered_districts_of_touched_provinces(adm2_path, risk_path):
+    Base.metadata.create_all(engine, tables=[Province.__table__, District.__table__])
+    with engine.begin() as conn:
+        conn.execute(insert(Province), [
+            {"province_id": 1, "province_name": "เชียงใหม่", "province_name_en": "Chiang Mai"},
+            {"province_id": 2, "province_name": "ลำพูน", "province_name_en": "Lamphun"},
+        ])
+        conn.execute(insert(District), [
+            {"district_id": 11, "province_id": 1, "district_name": "ก", "district_name_en": "District A"},
+            {"district_id": 12, "province_id": 1, "district_name": "ข", "district_name_en": "District B"},
+            {"district_id": 13, "province_id": 1, "district_name": "ค", "district_name_en": "District C"},
+            {"district_id": 21, "province_id": 2, "district_name": "ง", "district_name_en": "District D"},
+        ])
+
+    with Session(engine) as db:
+        result = area_risk_points(db, 7, risk_path, adm2_path)
+
+    levels = dict(zip(result["district_id"], result["risk_level"]))
+    # A: 2.11 → 3, B: 3 → 3, C: ไม่มี polygon แต่อยู่ในจังหวัดเดียวกัน → 1, D: จังหวัดที่ไม่ถูกแตะ → ไม่มีแถว
+    assert levels == {11: 3, 12: 3, 13: 1}
+    assert set(result["upload_risk_id"]) == {7}
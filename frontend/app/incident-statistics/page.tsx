@@ -2,7 +2,7 @@
 import React, { useEffect, useState, Fragment } from 'react';
 import { Button, Card, Upload, UploadProps, message, Table, Row, Col, Breadcrumb, Modal, Spin, Select, Space, Typography, DatePicker } from 'antd';
 import { UploadOutlined, DatabaseOutlined, InboxOutlined} from '@ant-design/icons';
-import { API_BASE, apiForm } from '@/lib/api';
+import { API_BASE, apiForm, waitForJob } from '@/lib/api';
 import type { TableProps } from 'antd';
 const { RangePicker } = DatePicker;
 import type { Dayjs } from 'dayjs';
@@ -132,7 +132,7 @@ export default function IncidentStatistics() {
 		async function fetchDistrict(province_id = filterOption.province_id, init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_district?province_id=${province_id}`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -164,7 +164,7 @@ export default function IncidentStatistics() {
 		async function fetchProvince(init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_province`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -249,7 +249,8 @@ export default function IncidentStatistics() {
 				const fd = new FormData();
 				fd.append('file', file as File);
 				setIsLoading(true);
-				await apiForm('/upload_excel', fd);
+				const { job_id } = await apiForm('/upload_excel', fd);
+				await waitForJob(job_id);
 				message.success('Upload Success');
 				await refresh();
 				onSuccess?.(null, file);
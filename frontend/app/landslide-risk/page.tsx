@@ -2,7 +2,7 @@
 import React, { useEffect, useState, Fragment } from 'react';
 import { Button, Card, Upload, UploadProps, message, Table, Row, Col, Breadcrumb, Modal, Spin, Select, Space, Typography } from 'antd';
 import { UploadOutlined, DatabaseOutlined, InboxOutlined} from '@ant-design/icons';
-import { API_BASE, apiForm } from '@/lib/api';
+import { API_BASE, apiForm, waitForJob } from '@/lib/api';
 import type { TableProps } from 'antd';
 
 type FilterOption = {
@@ -121,7 +121,7 @@ export default function LandSideRisk() {
 		async function fetchDistrict(province_id = filterOption.province_id, init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_district?province_id=${province_id}`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -153,7 +153,7 @@ export default function LandSideRisk() {
 		async function fetchProvince(init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_province`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -230,7 +230,8 @@ export default function LandSideRisk() {
 				const fd = new FormData();
 				fd.append('file', file as File);
 				setIsLoading(true);
-				await apiForm('/upload_dbf', fd);
+				const { job_id } = await apiForm('/upload_dbf', fd);
+				await waitForJob(job_id);
 				message.success('Upload Success');
 				await refresh();
 				onSuccess?.(null, file);
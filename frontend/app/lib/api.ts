@@ -21,4 +21,18 @@ export async function apiForm(path: string, form: FormData, init: RequestInit =
 	});
 	if (!res.ok) throw new Error(await res.text());
 	return res.json();
-}
\ No newline at end of file
+}
+
+// ingest ปกติจบในไม่กี่นาที; เกิน timeout ถือว่า job ค้าง (เช่น queued ไม่มี worker รับ) แทนการรอไม่สิ้นสุด
+export async function waitForJob(jobId: number, intervalMs = 2000, timeoutMs = 30 * 60 * 1000) {
+	const deadline = Date.now() + timeoutMs;
+	while (true) {
+		const job = await apiJSON(`/jobs/${jobId}`);
+		if (job.state === 'done') return job;
+		if (job.state === 'failed') throw new Error(job.error || 'Ingest failed');
+		if (Date.now() >= deadline) {
+			throw new Error(`Ingest job ${jobId} is still ${job.state} after ${Math.round(timeoutMs / 60000)} min` + (job.error ? `: ${job.error}` : ''));
+		}
+		await new Promise((resolve) => setTimeout(resolve, intervalMs));
+	}
+}
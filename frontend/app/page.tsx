@@ -29,7 +29,7 @@ type DataSourceRow = {
     district_name: string
     province_name_en: string
     district_name_en: string
-    risk_level: number
+    risk_level: number | null
     count_of_disasters: number
 };
 
@@ -43,7 +43,7 @@ type DataSource = [{
     district_name: string
     province_name_en: string
     district_name_en: string
-    risk_level: number
+    risk_level: number | null
     count_of_disasters: number
 }];
 
@@ -74,7 +74,7 @@ export default function Home() {
 		// const total = rainFactor + riskFactor + disasterFactor;
 		// return Math.min(100, total); // จำกัดไม่เกิน 100%
 
-		const base = (row.rain_mm_wmean / 2) + (row.risk_level * 10);
+		const base = (row.rain_mm_wmean / 2) + ((row.risk_level ?? 0) * 10);
 		if (row.count_of_disasters > 0) {
 			const boosted = base + row.count_of_disasters * 5;
 			return Math.min(100, Math.max(80, boosted)); // อย่างน้อย 80%
@@ -105,7 +105,7 @@ export default function Home() {
 	useEffect(() => {
 		async function fetchDataLimitDate(init: RequestInit = {}) {
 			const resDay = await fetch(`${API_BASE}/get_date_limit`, { 
-				cache: "no-store",
+				cache: "no-cache",
 				credentials: 'include',
 				headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 				...init,
@@ -219,7 +219,7 @@ export default function Home() {
 									<b>จังหวัด: ${p.data.province_name} (${p.data.province_name_en})</b><br/>
 									<b>อำเภอ : ${p.data.district_name} (${p.data.district_name_en})</b><br/>
 									<b>ปริมาณฝน (mm): ${p.data.rain_mm_wmean ?? 0}</b><br />
-									<b>ความเสี่ยงของพื้นที่: ${(p.data.risk_level == 1 ? 'ความเสี่ยงต่ำ (Low risk)' : (p.data.risk_level == 2 ? 'ความเสี่ยงปานกลาง (Medium risk)' : 'ความเสี่ยงสูง (High risk)'))}</b><br/>
+									<b>ความเสี่ยงของพื้นที่: ${(p.data.risk_level == null ? 'ไม่มีข้อมูล (No data)' : (p.data.risk_level == 1 ? 'ความเสี่ยงต่ำ (Low risk)' : (p.data.risk_level == 2 ? 'ความเสี่ยงปานกลาง (Medium risk)' : 'ความเสี่ยงสูง (High risk)')))}</b><br/>
 									<b>จำนวนครั้งที่เกิดภัยพิบัติ: ${p.data.count_of_disasters ?? 0} ครั้ง</b><br />
 									<b>ความเสี่ยง: ${p.data.dataEstimateProbability ?? 0}%</b><br />
 									</div>
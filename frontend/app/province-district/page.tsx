@@ -94,7 +94,7 @@ export default function ProvinceDistrict() {
 		async function fetchDistrict(province_id = filterOption.province_id, init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_district?province_id=${province_id}`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -126,7 +126,7 @@ export default function ProvinceDistrict() {
 		async function fetchProvince(init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_province`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
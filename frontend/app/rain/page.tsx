@@ -1,8 +1,8 @@
 'use client';
 import React, { useEffect, useState, Fragment } from 'react';
-import { Button, Card, Upload, UploadProps, message, Table, Row, Col, Breadcrumb, Modal, Spin, Select, Space, Typography, DatePicker } from 'antd';
+import { Button, Card, Upload, UploadProps, message, Table, Row, Col, Breadcrumb, Modal, Spin, Select, Space, Typography, DatePicker, Checkbox } from 'antd';
 import { UploadOutlined, DatabaseOutlined, InboxOutlined} from '@ant-design/icons';
-import { API_BASE, apiForm } from '@/lib/api';
+import { API_BASE, apiForm, waitForJob } from '@/lib/api';
 import type { TableProps } from 'antd';
 const { RangePicker } = DatePicker;
 import type { Dayjs } from 'dayjs';
@@ -55,6 +55,7 @@ export default function Rain() {
 	});
 	const [page, setPage] = useState(1);
   	const [pageSize, setPageSize] = useState(10);
+	const [onlyNewDays, setOnlyNewDays] = useState(false);
 
 	const showModal = () => {
 		setOpen(true);
@@ -130,7 +131,7 @@ export default function Rain() {
 		async function fetchDistrict(province_id = filterOption.province_id, init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_district?province_id=${province_id}`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -162,7 +163,7 @@ export default function Rain() {
 		async function fetchProvince(init: RequestInit = {}) {
 			try {
 				const res = await fetch(`${API_BASE}/list_province`, { 
-					cache: "no-store",
+					cache: "no-cache",
 					credentials: 'include',
 					headers: { 'Content-Type': 'application/json', ...(init.headers || {}) },
 					...init,
@@ -246,8 +247,11 @@ export default function Rain() {
 			try {
 				const fd = new FormData();
 				fd.append('file', file as File);
+				// ค่าเริ่มต้นประมวลผลทุกวันในไฟล์ → ไฟล์ที่แก้ค่าย้อนหลังใต้ชื่อเดิมถูก upsert ครบ
+				fd.append('full_reload', onlyNewDays ? 'false' : 'true');
 				setIsLoading(true);
-				await apiForm('/upload', fd);
+				const { job_id } = await apiForm('/upload', fd);
+				await waitForJob(job_id);
 				message.success('Upload Success');
 				await refresh();
 				onSuccess?.(null, file);
@@ -404,6 +408,9 @@ export default function Rain() {
 					destroyOnHidden={true}
 				>
 					<Spin spinning={isLoading} size={`large`}>
+						<Checkbox checked={onlyNewDays} onChange={(e) => setOnlyNewDays(e.target.checked)} style={{ marginBottom: 16 }}>
+							อ่านเฉพาะวันที่ใหม่กว่าที่มีในระบบของไฟล์ชื่อเดียวกัน (Only new days)
+						</Checkbox>
 						<Upload.Dragger {...uploadNCProps}>
 							<p className="ant-upload-drag-icon">
 								<UploadOutlined />